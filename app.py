@@ -8,11 +8,9 @@ import getpass
 import io
 import shutil
 import copy
+from functools import partial
 
-import numpy as np
-import pandas as pd
-import pyotp
-import qrcode
+import threading
 from io import BytesIO
 from datetime import datetime, time, timedelta
 import calendar
@@ -28,12 +26,7 @@ from flask import session as cookie_session
 
 from flask_cors import CORS
 
-from bokeh.io import output_file, show
-from bokeh.plotting import figure
-from bokeh.embed import components
-from bokeh.models import (Range1d, LinearAxis, ColumnDataSource, HoverTool,
-                          TapTool, CustomJS, FuncTickFormatter,
-                          NumeralTickFormatter, CustomJSTickFormatter)
+# pandas, numpy and bokeh are imported inside the routes that draw tables and charts, so workers boot without them
 
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives import hashes
@@ -54,14 +47,32 @@ from dcbc.models.dailydb import Daily
 from dcbc.models.eventdb import Event
 from dcbc.models.outings import Outing
 from dcbc.models.hoursdb import Hourly
+from dcbc.models.syncdb import SyncState
+from dcbc.models.strokedb import StrokeData
+from dcbc.models.splitsdb import WorkoutSplit, WorkoutInterval
+from dcbc.models.tokendb import Token
 from dcbc.models.base import Base
 
 from dcbc.project.session import session, engine
 from dcbc.project.auth_utils import load_secrets, setup_auth, load_users, get_decrypt_pass, auth_decorator, superuser_check
-from dcbc.project.utils import format_seconds
+from dcbc.project.utils import format_seconds, format_seconds_array, format_deciseconds, format_splits
+from dcbc.project.queries import workout_page, workout_types, table_query, TABLE_COLUMNS, SORT_COLUMNS
+from dcbc.project.pbs import user_bests
+from dcbc.project.downsample import target_points
+from dcbc.project.sync import sync_from_date, update_sync_state
+from dcbc.project.ingest import ingest_results, delete_workouts, workout_to_result, load_workout_details, handle_webhook_events
+from dcbc.project.ingest_queue import IngestQueue, QueueWorker
+from dcbc.project.prefetch import schedule_prefetch, prefetch_workouts, PREFETCH_BATCH
+from dcbc.project.backfill import backfill
+from dcbc.project.strokes import stroke_count, store_strokes
+from dcbc.project.concept2 import Concept2Client, AUTH_URL, SCOPE
+from dcbc.project.tokens import TokenStore
+from dcbc.project.token_refresh import TokenRefresher
+from dcbc.project.profiles import ProfileCache
 
 from dcbc.routes.captains import captains_bp
 from dcbc.routes.coaches import coach_bp
+from dcbc.routes.api import api_bp
 
 class R(flask.Request):
     trusted_hosts = {'downingboatclub.soc.srcf.net', 'row.downingboatclub.co.uk', 'www.row.downingboatclub.co.uk'}
@@ -79,11 +90,11 @@ CORS(app, resources={r"/*": {"origins": [
     r"https://*.concept2.com"
 ]}})
 
-Base.metadata.create_all(engine)
-session.commit()
+# Tables and indexes are managed by `python -m dcbc.manage migrate`, not on import
 
 app.register_blueprint(captains_bp)
 app.register_blueprint(coach_bp)
+app.register_blueprint(api_bp)
 
 # Commented to allow access from custom urls
 # app.config['SERVER_NAME'] = 'downingboatclub.soc.srcf.net'
@@ -96,6 +107,9 @@ app.wsgi_app = ProxyFix(
 # Change the before_request behaviour to vary per request
 @app.before_request
 def check_authentication():
+    # Background threads start with the first request a worker serves, after gunicorn has forked it
+    start_background_workers()
+
     # Skip authentication check for specified paths
     if request.path.startswith('/static/') or request.path.startswith('/coach') or request.path in ['/coach', '/favicon.ico', '/webhook']:
         return None
@@ -111,60 +125,83 @@ def inject_superuser():
     is_superuser = superuser_check(crsid)  # Check if the user is a superuser
     return dict(superuser=is_superuser)
 
-# Load secrets
-secrets = load_secrets()
+# Callback URI after authorization on Concept2
+REDIRECT_URI = 'https://downingboatclub.soc.srcf.net/callback'
 
-# Set up the authentication
-CLIENT_ID, CLIENT_SECRET, decryptkey, datacipher = setup_auth(secrets)
+# Secrets, keys and shared clients - filled in once by create_app(), then used directly by the routes below
+secrets = None
+CLIENT_ID = CLIENT_SECRET = decryptkey = datacipher = None
+authusers, superusers = [], []
+tokens = concept2 = profiles = ingest_queue = None
 
-# Load authorized users and superusers
-authusers_file = 'dcbc/data/auth_users.txt'
-superusers_file = 'dcbc/data/super_users.txt'
-authusers, superusers = load_users(authusers_file, superusers_file)
+# Build the app's shared state
+# Run once in the gunicorn master (--preload) so the PBKDF2 key derivation happens a single time and
+# the result is shared copy-on-write by every worker; nothing here opens a database connection
+def create_app():
+    global secrets, CLIENT_ID, CLIENT_SECRET, decryptkey, datacipher, authusers, superusers
+    global tokens, concept2, profiles, ingest_queue
 
-# Pull in the app secret key
-app.secret_key = secrets.get('secret_key')
+    if concept2 is not None:
+        return app
 
-# Callback URI after authorization on Concept2
-REDIRECT_URI = 'https://downingboatclub.soc.srcf.net/callback'
+    # Load secrets
+    secrets = load_secrets()
 
-# Authorization URL
-AUTH_URL = 'https://log.concept2.com/oauth/authorize'
+    # Set up the authentication
+    CLIENT_ID, CLIENT_SECRET, decryptkey, datacipher = setup_auth(secrets)
 
-# User URL
-USER_URL = 'https://log.concept2.com/api/users/me'
+    # Load authorized users and superusers
+    authusers_file = 'dcbc/data/auth_users.txt'
+    superusers_file = 'dcbc/data/super_users.txt'
+    authusers, superusers = load_users(authusers_file, superusers_file)
 
-# Token URL
-TOKEN_URL = 'https://log.concept2.com/oauth/access_token'
+    # Pull in the app secret key
+    app.secret_key = secrets.get('secret_key')
 
-def flatten_data(data):
-    df = pd.json_normalize(data['data'])
+    # Shared Concept2 API client - pooled connections, retries and token refresh
+    # Tokens live encrypted in the database, with decrypted copies cached in each worker
+    tokens = TokenStore(datacipher)
+    concept2 = Concept2Client(CLIENT_ID, CLIENT_SECRET, tokens)
 
-    if 'workout' in df.columns:
-        if 'intervals' in df['workout'][0]:
-            intervals_df = pd.json_normalize(
-                [item for sublist in df['workout'].apply(lambda x: x.get('intervals', [])) for item in sublist],
-                sep='_'
-            )
-        else:
-            intervals_df = pd.DataFrame()
+    # Concept2 profiles behind /login and /setup
+    profiles = ProfileCache(concept2, datacipher)
 
-        if 'splits' in df['workout'][0]:
-            splits_df = pd.json_normalize(
-                [item for sublist in df['workout'].apply(lambda x: x.get('splits', [])) for item in sublist],
-                sep='_'
-            )
-        else:
-            splits_df = pd.DataFrame()
+    # Durable queue behind /webhook, drained in batches by a background thread in each worker
+    ingest_queue = IngestQueue()
 
-        df = df.drop(columns=['workout'])
-        df = pd.concat([df, intervals_df, splits_df], axis=1)
+    return app
 
-    if 'date' in df.columns:
-        df['date'] = pd.to_datetime(df['date'],format='ISO8601')
-        df = df.sort_values(by='date', ascending=True)
+# Store webhook results, then line up a low-priority fetch of their strokes
+def ingest_webhooks(events):
+    schedule_prefetch(ingest_queue, handle_webhook_events(events))
 
-    return df
+# Process that owns the running background threads - threads do not survive a fork, so each worker starts its own
+workers_pid = None
+workers_lock = threading.Lock()
+
+def start_background_workers():
+    global workers_pid
+
+    if workers_pid == os.getpid():
+        return
+
+    with workers_lock:
+        if workers_pid == os.getpid():
+            return
+
+        # Drop any pooled connections inherited from the master without closing them under its feet
+        engine.dispose(close=False)
+
+        QueueWorker(ingest_queue, {'webhook': ingest_webhooks}).start()
+
+        # Prefetching waits on Concept2, so it gets its own thread and never holds up webhook ingestion
+        QueueWorker(ingest_queue, {'prefetch': partial(prefetch_workouts, concept2)},
+                    limit=PREFETCH_BATCH, name='prefetch-queue').start()
+
+        # Renew tokens shortly before they lapse so pages and the cron job rarely pay for an inline refresh
+        TokenRefresher(concept2).start()
+
+        workers_pid = os.getpid()
 
 # Stop gunicorn caching responses - which require dynamic updating!
 @app.teardown_appcontext
@@ -216,8 +253,6 @@ def login():
 
     # Check if the user already exists - which should have created a directory for their data
     if os.path.exists(file_path):
-        token_path = f'{file_path}/token.txt' # Load in user token on login if it exists
-
         user = session.execute(select(User).where(User.crsid == crsid)).scalars().first()
 
         # Initialize the dictionary with user data from the database
@@ -229,66 +264,11 @@ def login():
         # If the user has added their logbook account, then refresh the user access token
         # TODO: Handle the refresh-token function in a dedicated way, only when the user requests data and is denied - using a ref argument to redirect back again
         if user_data['logbook'] == True:
-            if os.path.exists(token_path):
-                with open(token_path, 'rb') as file:
-                    encrypted_data = file.read()
-
-                # Decrypt the data
-                token_data = json.loads(datacipher.decrypt(encrypted_data).decode())
-
-            else:
+            if not concept2.has_token(crsid):
                 return(redirect(url_for('authorize')))
 
-            authorized = 'access_token' in token_data
-
-            if authorized:
-                access_token = token_data['access_token']
-
-                headers = {
-                    'Authorization': f'Bearer {access_token}',
-                    'Content-Type': 'application/json'
-                }
-
-                response = requests.get(USER_URL, headers=headers)  # Use GET to retrieve user data
-
-                # Do not refresh if the user token is still valid
-                if response.status_code == 200:
-                    user_data = response.json()['data']
-
-                    info_file = f'{file_path}/user_info.txt'
-
-                    user_data_json = json.dumps(user_data)
-
-                    # Encrypt the JSON string
-                    encrypted_data = datacipher.encrypt(user_data_json.encode())
-
-                    # Write the encrypted data to the file
-                    with open(info_file, 'wb') as file:  # Note 'wb' mode for binary writing
-                        file.write(encrypted_data)
-
-                # Otherwise get a new token
-                else:
-                    refresh_token = token_data['refresh_token']
-
-                    token_params = {
-                        'grant_type': 'refresh_token',
-                        'client_id': CLIENT_ID,
-                        'client_secret': CLIENT_SECRET,
-                        'scope': 'user:read,results:read',
-                        'refresh_token': refresh_token
-                    }
-
-                    response = requests.post(TOKEN_URL, data=token_params)
-                    token_data = response.json()
-
-                    token_data_json = json.dumps(token_data)
-
-                    # Encrypt the JSON string
-                    encrypted_data = datacipher.encrypt(token_data_json.encode())
-
-                    # Write the encrypted data to the file
-                    with open(token_path, 'wb') as file:  # Note 'wb' mode for binary writing
-                        file.write(encrypted_data)
+            # Only calls Concept2 when the token's expiry is unknown or past, or no profile is stored yet
+            profiles.check(crsid)
 
         resp = make_response(redirect(url_for('index')))
 
@@ -356,28 +336,12 @@ def setup():
 
     # Account creation with a logbook referral
     else:
-        # This is going to need replacing, but it is low priority - would rather keep these encrypted like this for now
-        token_path = f'{file_path}/token.txt'
-
-        if not os.path.exists(token_path):
+        if not concept2.has_token(crsid):
             return(redirect(url_for('login')))
 
-        with open(token_path, 'rb') as file:
-            encrypted_data = file.read()
-
-        token_data = json.loads(datacipher.decrypt(encrypted_data).decode())
-
         # Using the access token, requests user information from concept2 which is used to set account data
-        access_token = token_data['access_token']
-
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-
-        response = requests.get(USER_URL, headers=headers)  # Retrieve data from the concept2 API
-        if response.status_code == 200:
-            user_data = response.json()['data']
+        user_data = profiles.get(crsid)  # Retrieve data from the concept2 API, or the recent cached copy
+        if user_data is not None:
             color = str("#"+''.join([random.choice('ABCDEF0123456789') for i in range(6)])) # Give each user a random color!
 
 
@@ -483,6 +447,7 @@ def user_settings():
 
 @app.route('/home')
 def index():
+    import numpy as np
 
     crsid = auth_decorator.principal
 
@@ -494,7 +459,7 @@ def index():
 
     file_path = f'dcbc/data/{crsid}'
 
-    if not os.path.exists(f'{file_path}/token.txt') and user_data.get('logbook') == True:
+    if user_data.get('logbook') == True and not concept2.has_token(crsid):
         return(redirect(url_for('authorize')))
 
     if user_data['logbook'] == True:
@@ -554,45 +519,12 @@ def index():
             ).scalars().all()
         workouts_dict = {index: copy.deepcopy(workout) for index, workout in enumerate(workouts)}
 
-        best2k = session.execute(select(
-            select(
-                Workout.user_id,
-                Workout.distance,
-                Workout.time,
-                Workout.workout_type,
-                Workout.date
-            )
-            .where(
-                Workout.user_id == logid,
-                Workout.distance == 2000,
-                Workout.workout_type == "FixedDistanceSplits"
-            )
-            .order_by(Workout.time.asc())
-            .limit(1)
-            .subquery()
-        )).first()
-
-        best5k = session.execute(select(
-            select(
-                Workout.user_id,
-                Workout.distance,
-                Workout.time,
-                Workout.workout_type,
-                Workout.date
-            )
-            .where(
-                Workout.user_id == logid,
-                Workout.distance == 5000,
-                Workout.workout_type == "FixedDistanceSplits"
-            )
-            .order_by(Workout.time.asc())
-            .limit(1)
-            .subquery()
-        )).first()
+        # Indexed point lookup - the PB tables are kept up to date at ingest
+        bests = user_bests(logid)
 
-        best2k_copy = {key: value for key, value in best2k._mapping.items()}.copy() if best2k else None
+        best2k_copy = {'time': bests['2k'].time, 'date': bests['2k'].date} if '2k' in bests else None
 
-        best5k_copy = {key: value for key, value in best5k._mapping.items()}.copy() if best5k else None
+        best5k_copy = {'time': bests['5k'].time, 'date': bests['5k'].date} if '5k' in bests else None
 
         if best2k_copy:
             best2k_copy['time'] = format_seconds(best2k_copy['time'] / 10)
@@ -602,9 +534,15 @@ def index():
             best5k_copy['time'] = format_seconds(best5k_copy['time'] / 10)
             best5k_copy['date'] = best5k_copy['date'].date()
 
-        for workout in workouts_dict.values():
-            workout.split = format_seconds((workout.time / 10) / (workout.distance / 500))
-            workout.time = format_seconds(workout.time / 10)
+        times = np.array([workout.time for workout in workouts_dict.values()], dtype=np.float64)
+        distances = np.array([workout.distance for workout in workouts_dict.values()], dtype=np.float64)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            splits = format_seconds_array((times / 10) / (distances / 500))
+
+        for workout, split, workout_time in zip(workouts_dict.values(), splits, format_deciseconds(times)):
+            workout.split = split
+            workout.time = workout_time
 
     else:
         workouts_dict = {}
@@ -621,7 +559,7 @@ def index():
 def authorize():
     params = {
         'client_id': CLIENT_ID,
-        'scope': 'user:read,results:read',
+        'scope': SCOPE,
         'response_type': 'code',
         'redirect_uri': REDIRECT_URI
     }
@@ -636,37 +574,18 @@ def callback():
     if not code:
         return 'No authorization code received.'
 
-    token_params = {
-        'grant_type': 'authorization_code',
-        'code': f'{code}',
-        'redirect_uri': REDIRECT_URI,
-        'client_id': CLIENT_ID,
-        'client_secret': CLIENT_SECRET
-    }
-
-    response = requests.post(TOKEN_URL, data=token_params)
-
-    token_data = response.json()
+    token_data = concept2.exchange_code(code, REDIRECT_URI)
 
     if 'access_token' not in token_data:
         return (f"Error - Expected access token, got invalid response")
 
     crsid = auth_decorator.principal
 
-    userpath = f'dcbc/data/{crsid}'
-    if not os.path.exists(userpath):
-        os.makedirs(userpath)
-
-    token_path = f'{userpath}/token.txt'
+    # Encrypt and store the new token
+    concept2.save_token(crsid, token_data)
 
-    token_data_json = json.dumps(token_data)
-
-    # Encrypt the JSON string
-    encrypted_data = datacipher.encrypt(token_data_json.encode())
-
-    # Write the encrypted data to the file
-    with open(token_path, 'wb') as file:  # Note 'wb' mode for binary writing
-        file.write(encrypted_data)
+    # The new token may belong to a different logbook account
+    profiles.forget(crsid)
 
     logbookid = session.execute(select(User.logbookid).where(User.crsid == crsid)).scalar()
 
@@ -678,7 +597,8 @@ def callback():
             <h1>Reload Data?</h1>
             <p>You have already previously loaded data, and you have {{ length_wd }} workouts loaded </p>
             <p><b>New workouts will sync automatically!</b></p>
-            <p><a href = "{{ url_for('load_all') }}"> I'm sure, load data</a></p>
+            <p><a href = "{{ url_for('load_all') }}"> I'm sure, load new data</a></p>
+            <p><a href = "{{ url_for('load_all', full=1) }}"> Reload my whole logbook history</a></p>
             <p><a href = "{{ url_for('index') }}">Go Home</a></p>
         ''', length_wd = length_wd))
 
@@ -699,182 +619,37 @@ def load_all():
     if 'crsid' in args and crsid in superusers:
         crsid = args.get('crsid')
 
-    file_path = f'dcbc/data/{crsid}'
-
-    token_path = f'{file_path}/token.txt'
-
-    if os.path.exists(token_path):
-        with open(token_path, 'rb') as file:
-            encrypted_data = file.read()
-
-        # Decrypt the data
-        token_data = json.loads(datacipher.decrypt(encrypted_data).decode())
-
-    else:
+    if not concept2.has_token(crsid):
         return(url_for("setup"))
 
-    access_token = token_data['access_token']
-    refresh_token = token_data['refresh_token']
-
-    data_headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json'
-    }
-
-    reset_all=True
-
-    data_params = {
-        "from": '2000-01-01',
-        "to": '2040-01-01'
-    }
-
-    data_url = "https://log.concept2.com/api/users/me/results"
-
-    response = requests.get(data_url, headers=data_headers, params=data_params)
-
-    dataresponse = response.json()
-
-    if 'data' not in dataresponse:
-        token_params = {
-            'grant_type': 'refresh_token',
-            'client_id': CLIENT_ID,
-            'client_secret': CLIENT_SECRET,
-            'scope': 'user:read,results:read',
-            'refresh_token': refresh_token
-        }
-
-        response = requests.post(TOKEN_URL, data=token_params)
-        token_data = response.json()
-
-        token_data_json = json.dumps(token_data)
-
-        # Encrypt the JSON string
-        encrypted_data = datacipher.encrypt(token_data_json.encode())
-
-        # Write the encrypted data to the file
-        with open(token_path, 'wb') as file:  # Note 'wb' mode for binary writing
-            file.write(encrypted_data)
-
-        data_headers = {
-            'Authorization': f'Bearer {token_data["access_token"]}',
-            'Content-Type': 'application/json'
-        }
-
-        response = requests.get(data_url, headers=data_headers)
-
-        dataresponse = response.json()
-
-        if 'data' not in dataresponse:
-            return(f'error - response is {dataresponse["status_code"]}, expected 200')
-
-    data_json = dataresponse.get('data')
-
-    if len(data_json) == 50:
-        len_recover = 50
-
-        while len_recover != 1:
-            old_set = data_json[-1].get('date')
-
-            data_params = {
-            "from": '2000-01-01',
-            "to": old_set,
-            }
-
-            response = requests.get(data_url, headers=data_headers, params=data_params)
-
-            dataresponse = response.json()
-
-            len_recover = len(flatten_data(dataresponse))
-
-            this_json = dataresponse.get('data')
-            data_json += this_json
+    # Only pull workouts newer than the stored high-water mark, unless a full resync is asked for
+    full_sync = 'full' in args
 
-    allowed_keys = {'id', 'user_id', 'date', 'distance', 'type', 'time', 'comments', 'heart_rate', 'stroke_rate', 'stroke_data'}
-
-    workouts = data_json
-
-    for workout_data in workouts:
-        filtered_workout_data = {
-            "id": workout_data.get("id"),
-            "user_id": workout_data.get("user_id"),
-            "date": workout_data.get("date", None),  # Use None as a default
-            "distance": workout_data.get("distance", None),
-            "type": workout_data.get("type", None),
-            "workout_type": workout_data.get("workout_type", None),
-            "time": workout_data.get("time", None),
-            "spm": workout_data.get("stroke_rate", None),
-            "avghr": workout_data.get("heart_rate", {}).get("average", None),
-            "comments": workout_data.get("comments", None),    # If missing, default to None
-            "stroke_data": workout_data.get("stroke_data", False),
-            "rest_time": workout_data.get("rest_time", 0)
-        }
-
-        # Convert date string to datetime object if it's not None
-        if filtered_workout_data["date"]:
-            filtered_workout_data["date"] = datetime.strptime(filtered_workout_data["date"], "%Y-%m-%d %H:%M:%S")
-
-        existing_workout = session.query(Workout).filter_by(id=filtered_workout_data['id']).first()
-
-        # Create Workout object with the filtered data
-        new_workout = Workout(**filtered_workout_data)
+    # Windows are fetched concurrently and each page is written as soon as it arrives
+    try:
+        synced_workouts = backfill(concept2, crsid, sync_from_date(crsid, full=full_sync))
+    except RuntimeError as e:
+        return(f'error - {e}')
 
-        # Add to session
-        session.merge(new_workout)
+    # Move the user's high-water mark on to the newest workout just loaded
+    update_sync_state(crsid, synced_workouts)
 
     # Commit all inserts to the database
     session.commit()
 
     return redirect(url_for('setup'))
 
-# Updated to SQL Handling - should be and was easy
+# Webhook payloads are journalled locally and written to the database by the queue worker
 @app.route('/webhook', methods=['POST'])
 def webhook():
     # Attempt to parse the incoming JSON
     if request.is_json:
         webhook_data = request.get_json()
 
-        # Get the type of event and the result payload
-        event_type = webhook_data.get('type')
-
-        if event_type != 'result-deleted':
-            workout_data = webhook_data.get('result')
-
-            filtered_workout_data = {
-                "id": workout_data.get("id"),
-                "user_id": workout_data.get("user_id"),
-                "date": workout_data.get("date", None),  # Use None as a default
-                "distance": workout_data.get("distance", None),
-                "type": workout_data.get("type", None),
-                "workout_type": workout_data.get("workout_type", None),
-                "time": workout_data.get("time", None),
-                "spm": workout_data.get("stroke_rate", None),
-                "avghr": workout_data.get("heart_rate", {}).get("average", None),
-                "comments": workout_data.get("comments", None),    # If missing, default to None
-                "stroke_data": workout_data.get("stroke_data", False),
-                "rest_time": workout_data.get("rest_time", 0)
-            }
-
-            # Convert date string to datetime object if it's not None
-            if filtered_workout_data["date"]:
-                filtered_workout_data["date"] = datetime.strptime(filtered_workout_data["date"], "%Y-%m-%d %H:%M:%S")
-
-            # Create Workout object with the filtered data
-            new_workout = Workout(**filtered_workout_data)
-
-            # Add to session
-            session.merge(new_workout)
-
-            # Commit all inserts to the database
-            session.commit()
-            webhook_data = request.get_json()
-
-        else:
-            result_id = webhook_data.get('result_id')
-
-            session.execute(delete(Workout).where(Workout.id == result_id))
-            session.commit()
+        # Durable as soon as this returns - the worker retries and dead-letters on database errors
+        ingest_queue.enqueue('webhook', webhook_data)
 
-        return "Result updated", 200
+        return "Result queued", 202
 
     else:
         return "Invalid content type", 400
@@ -882,7 +657,6 @@ def webhook():
 # Updated to SQL! Errors might need testing
 @app.route(f'/plot', methods=['GET', 'POST'])
 def plot():
-
     usrid = auth_decorator.principal
     args = request.args
 
@@ -899,144 +673,29 @@ def plot():
     else:
         crsid = auth_decorator.principal
 
-    file_path = f'dcbc/data/{crsid}'
-
     logid = session.execute(select(User.logbookid).where(User.crsid == crsid)).scalar()
 
-    query = select(Workout).where(Workout.user_id == logid, Workout.type == "rower")
-
-    # Use pandas to read the query result into a DataFrame
-    df = pd.read_sql(query, engine)
-
     if logid is None:
         if session.execute(select(User.crsid).where(User.crsid == crsid)).scalars().first() is None and otherview:
             return(render_template(
                 template_name_or_list='plot.html',
-                script=[''],
-                div=[f' <p>No specified user <b>{crsid}</b> found!<a href={ url_for("index")}> Return to home </a></p>'],
-                otherview=otherview, crsid=crsid,
-                club = url_for('club'), home = url_for('index'), data_url = url_for('data'), plot=url_for('plot')))
-
-        return(render_template(
-            template_name_or_list='plot.html',
-            script=[''],
-            div=[f'No user found! <p><a href={ url_for("login")}> Return to login </a></p>'],
-            otherview=otherview, crsid=crsid,
-            club = url_for('club'), home = url_for('index'), data_url = url_for('data'), plot=url_for('plot')))
-
-    if df is None:
-        if session.execute(select(User.crsid).where(User.crsid == crsid)).scalars().first() is None and otherview:
-            return(render_template(
-                template_name_or_list='plot.html',
-                script=[''],
-                div=[f'No specified user data found! <p><a href={ url_for("index")}> Return to home </a></p>'],
+                chart_url=None,
+                message=f' <p>No specified user <b>{crsid}</b> found!<a href={ url_for("index")}> Return to home </a></p>',
                 otherview=otherview, crsid=crsid,
                 club = url_for('club'), home = url_for('index'), data_url = url_for('data'), plot=url_for('plot')))
 
         return(render_template(
             template_name_or_list='plot.html',
-            script=[''],
-            div=[f'No data found! Check you have logged some ergs before coming here. <p><a href={ url_for("index")}> Return to home </a></p>'],
+            chart_url=None,
+            message=f'No user found! <p><a href={ url_for("login")}> Return to login </a></p>',
             otherview=otherview, crsid=crsid,
             club = url_for('club'), home = url_for('index'), data_url = url_for('data'), plot=url_for('plot')))
 
-    df['date'] = pd.to_datetime(df['date'])
-    df['distance'] = pd.to_numeric(df['distance'], errors='coerce')
-
-    df['split'] = round((df['time'] / 10) / (df ['distance'] / 500),1)
-
-    if 'from_date' in args and 'to_date' in args:
-        from_date = args.get('from_date')
-        to_date = args.get('to_date')
-
-    else:
-        from_date = datetime.strptime('2024-10-01', '%Y-%m-%d')
-        to_date = datetime.strptime('2025-06-30', '%Y-%m-%d')
-
-    df = df[(df['date'] >= from_date) & (df['date'] <= to_date)]
-
-    df['split'] = df['split'].apply(format_seconds)
-
-    df = df.sort_values("date")
-
-    p1 = figure(height=350, sizing_mode='stretch_width', x_axis_type='datetime')
-
-    # Plot the second dataset on the right y-axis
-    p1.line(
-        df['date'],
-        df['distance'].cumsum(),
-        color='magenta',
-        alpha=0.8,
-        line_width=3)
-
-
-    p1.yaxis.formatter = NumeralTickFormatter(format='0.0a')
-
-    one_day = 24 * 60 * 60 * 1000
-
-    df['date_day'] = df['date'].dt.floor('D')
-    df['cumsum'] = df.groupby('date_day')['distance'].cumsum()
-    df['base'] = df['cumsum'] - df['distance']
-
-    # Create a ColumnDataSource
-    source = ColumnDataSource(df)
-
-    p1.extra_y_ranges = {"daily": Range1d(start=0, end=df['cumsum'].max())}
-    p1.add_layout(LinearAxis(y_range_name="daily", axis_label="Daily Metres"), 'right')
-
-    # Set the width to 1 day in milliseconds
-    one_day = 24 * 60 * 60 * 1000
-
-    # Plot the stacked bars
-    p1.vbar(x='date_day',
-           top='cumsum',
-           bottom='base',
-           width=one_day,
-           color='grey',
-           alpha=0.8,
-           source=source,
-           y_range_name='daily')
-
-    hover = HoverTool(tooltips=[
-        ("Date", "@date_day{%F}"),
-        ("Distance", "@distance"),
-        ("Split", "@split"),
-    ], formatters={
-        '@date_day': 'datetime',  # use 'datetime' formatter for '@date_day' field
-    }, mode='mouse',renderers=[p1.renderers[1]])
-
-    callback = CustomJS(args={'source': source, 'crsid':crsid}, code="""
-        console.log('CustomJS callback triggered');
-
-        // Access the ColumnDataSource
-        var data = source.data;
-
-        // Access the selected indices
-        var selected_indices = source.selected.indices;
-
-        if (selected_indices.length > 0) {
-            var index = selected_indices[0];
-            var item_id = data['id'][index];
-
-            // Redirect to the Flask route with item_id as a parameter
-            window.location.href = '/workout?id=' + item_id + '&crsid=' + crsid;
-        } else {
-            console.log('No item selected');
-        }
-    """)
-    # Add TapTool with the CustomJS callback
-    tap_tool = TapTool(callback=callback)
-    p1.add_tools(tap_tool)
-
-    p1.add_tools(hover)
-
-    script1, div1 = components(p1)
-
+    # Drawn in the browser from the JSON endpoint, with the same crsid and dates
     return(render_template(
         template_name_or_list='plot.html',
-        script=[script1],
-        div=[div1],
-        df=df, otherview=otherview, crsid=crsid,
+        chart_url=url_for('api.plot', **args.to_dict()),
+        otherview=otherview, crsid=crsid,
         club = url_for('club'), home = url_for('index'), data_url = url_for('data'), plot=url_for('plot')))
 
 # Updated to SQL
@@ -1052,60 +711,26 @@ def data():
 
     logid = session.execute(select(User.logbookid).where(User.crsid == crsid)).scalar()
 
-    query = select(Workout).where(Workout.user_id == logid)
-
-    # Use pandas to read the query result into a DataFrame
-    df = pd.read_sql(query, engine)
-
-    df['date'] = pd.to_datetime(df['date'])
-    df['distance'] = pd.to_numeric(df['distance'], errors='coerce')
-
-    df['split'] = round((df['time'] / 10) / (df ['distance'] / 500),1)
-
-    if 'from_date' in args and 'to_date' in args:
-        from_date = args.get('from_date')
-        to_date = args.get('to_date')
-
-    else:
-        from_date = '2024-01-01'
-        to_date = '2024-12-31'
-
-    df = df[(df['date'] >= from_date) & (df['date'] <= to_date)]
-
-    df['split'] = df['split'].apply(format_seconds)
-
-    totaldist = df['distance'].sum()
-    totaltime = format_seconds((df['time'].sum())/10)
-
-    df['time'] = (df['time']/10).apply(format_seconds)
-
-    df = df.sort_values("date")
+    query = table_query(args)
 
-    max_select = ['id','date','distance','time','split','spm','type','workout_type','avghr','comments']
-    selects = []
-
-    for item in max_select:
-        if item in df.keys():
-            selects.append(item)
-
-    subdf = df[selects].copy()
+    # Only one page of rows is fetched and formatted - the totals come from an aggregate over the whole selection
+    table = workout_page(logid, **query)
 
     headers = ['id','Date','Distance','Time','Split / 500m','Stroke Rate','Type','Workout Type','Average HR','Comments']
 
-    # Apply the function to each cell in the DataFrame
-    if 'stroke_rate' in subdf:
-        subdf['stroke_rate'] = subdf['stroke_rate'].apply(lambda x: int(x) if isinstance(x, (float, int)) and not pd.isna(x) else x)
+    # Links that keep the current dates, filter and crsid, changing just the sort or page
+    def table_url(**changes):
+        return url_for('data', **{**args.to_dict(), **changes})
 
-    subdf.replace({np.nan: None, 'unknown': None}, inplace=True)
-
-    subdf_dict = subdf.to_dict(orient='records')
-
-    return render_template('data.html', data=subdf_dict, crsid=crsid,
-        club = url_for('club'), home = url_for('index'), data_url = url_for('data'), plot=url_for('plot'), headers=headers, totaldist=totaldist, totaltime=totaltime)
+    return render_template('data.html', data=table['rows'], crsid=crsid,
+        club = url_for('club'), home = url_for('index'), data_url = url_for('data'), plot=url_for('plot'), headers=headers,
+        totaldist=table['totaldist'], totaltime=table['totaltime'], table=table, query=query, table_url=table_url,
+        columns=TABLE_COLUMNS, sort_columns=SORT_COLUMNS, erg_types=workout_types(logid))
 
 # Updated to SQL
 @app.route('/workout')
 def workout():
+    import numpy as np
 
     usrid = auth_decorator.principal
     args = request.args
@@ -1132,150 +757,60 @@ def workout():
 
     logid = session.execute(select(User.logbookid).where(User.crsid == crsid)).scalar()
 
-    data_url = f"https://log.concept2.com/api/users/{logid}/results/{workoutid}"
-
-    file_path = f'dcbc/data/{crsid}'
-
-    token_path = f'{file_path}/token.txt'
-
-    if os.path.exists(token_path):
-        with open(token_path, 'rb') as file:
-            encrypted_data = file.read()
-
-        # Decrypt the data
-        token_data = json.loads(datacipher.decrypt(encrypted_data).decode())
-
-    access_token = token_data['access_token']
-    refresh_token = token_data['refresh_token']
-
-    data_headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json'
-    }
-
-    response = requests.get(data_url, headers=data_headers)
-
-    dataresponse = response.json()
-
-    if 'data' not in dataresponse:
-        token_params = {
-            'grant_type': 'refresh_token',
-            'client_id': CLIENT_ID,
-            'client_secret': CLIENT_SECRET,
-            'scope': 'user:read,results:read',
-            'refresh_token': refresh_token
-        }
-
-        response = requests.post(TOKEN_URL, data=token_params)
-        token_data = response.json()
+    # Serve the summary from the local table when we have it, only asking Concept2 otherwise
+    stored_workout = session.execute(
+        select(Workout).where(Workout.id == workoutid, Workout.user_id == logid)
+    ).scalars().first()
 
-        token_data_json = json.dumps(token_data)
+    if stored_workout is not None:
+        res = workout_to_result(stored_workout)
 
-        # Encrypt the JSON string
-        encrypted_data = datacipher.encrypt(token_data_json.encode())
+        # Split / interval breakdown straight from the local tables
+        details = load_workout_details(res['id'])
 
-        # Write the encrypted data to the file
-        with open(token_path, 'wb') as file:  # Note 'wb' mode for binary writing
-            file.write(encrypted_data)
+    # Not stored yet, or stored before splits and intervals were kept - fetch it once from Concept2
+    if stored_workout is None or not (details['splits'] or details['intervals']):
+        dataresponse = concept2.get(crsid, f'users/{logid}/results/{workoutid}')
 
-        data_headers = {
-            'Authorization': f'Bearer {token_data["access_token"]}',
-            'Content-Type': 'application/json'
-        }
+        if 'data' in dataresponse:
+            res = dataresponse['data']
 
-        response = requests.get(data_url, headers=data_headers)
+            # Keep it, with its splits and intervals, so the next view is local
+            ingest_results([res])
+            session.commit()
 
-        dataresponse = response.json()
+            details = load_workout_details(res['id'])
 
-        if 'data' not in dataresponse:
-            return(f'error - response is {dataresponse["status_code"]}, expected 200')
+        # An older stored workout is still shown, just without its breakdown
+        elif stored_workout is None:
+            return(f'error - response is {dataresponse.get("status_code")}, expected 200')
 
-    res = dataresponse['data']
+    chart_url = full_url = None
 
     if res['stroke_data']:
-        stroke_url = f"https://log.concept2.com/api/users/{logid}/results/{workoutid}/strokes"
-
-        data_headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-
-        response = requests.get(stroke_url, headers=data_headers)
-
-        strokeresponse = response.json()
-
-        if 'data' not in dataresponse:
-            token_params = {
-                'grant_type': 'refresh_token',
-                'client_id': CLIENT_ID,
-                'client_secret': CLIENT_SECRET,
-                'scope': 'user:read,results:read',
-                'refresh_token': refresh_token
-            }
-
-            response = requests.post(TOKEN_URL, data=token_params)
-            token_data = response.json()
-
-            token_data_json = json.dumps(token_data)
-
-            # Encrypt the JSON string
-            encrypted_data = datacipher.encrypt(token_data_json.encode())
-
-            # Write the encrypted data to the file
-            with open(token_path, 'wb') as file:  # Note 'wb' mode for binary writing
-                file.write(encrypted_data)
-
-            data_headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Content-Type': 'application/json'
-            }
-
-            response = requests.get(stroke_url, headers=data_headers)
-
-            strokeresponse = response.json()
+        count = stroke_count(workoutid)
 
-        strokes = flatten_data(strokeresponse)
+        # First view of this workout - fetch the strokes once and keep them
+        if count is None:
+            strokeresponse = concept2.get(crsid, f'users/{logid}/results/{workoutid}/strokes')
 
-        p1 = figure(height=350, sizing_mode='stretch_width', x_axis_type='datetime')
+            if 'data' not in strokeresponse:
+                return(f'error - response is {strokeresponse.get("status_code")}, expected 200')
 
-        p1.y_range = Range1d(start=(strokes['p'].min()*0.8)/10, end=(strokes['p'].max()*1.2)/10)
-        # Plot the second dataset on the right y-axis
-        p1.line(
-            strokes['t']/10,
-            strokes['p']/10,
-            color='magenta',
-            alpha=0.8,
-            line_width=3)
-
-        p1.extra_y_ranges = {"spm": Range1d(start=0, end=strokes['spm'].max()*1.2)}
-        p1.add_layout(LinearAxis(y_range_name="spm", axis_label="Strokes per Minute"), 'right')
+            store_strokes(res['id'], strokeresponse['data'])
+            session.commit()
 
-        p1.line(
-            strokes['t']/10,
-            strokes['spm'],
-            color='grey',
-            alpha=0.8,
-            line_width=3,
-            y_range_name='spm')
+            count = len(strokeresponse['data'])
 
-        p1.xaxis.formatter = CustomJSTickFormatter(code="""
-            var minutes = Math.floor(tick / 60);
-            var seconds = (tick % 60).toFixed(1);
-            return minutes + ":" + (seconds < 10 ? "0" : "") + seconds;
-        """)
+        # Drawn in the browser from the JSON endpoint, thinned to about one point per pixel unless ?full=1
+        chart_args = {key: value for key, value in args.items() if key != 'id'}
+        chart_url = url_for('api.workout', workout_id=res['id'], **chart_args)
 
-        p1.yaxis[0].formatter = CustomJSTickFormatter(code="""
-            var minutes = Math.floor(tick / 60);
-            var seconds = (tick % 60).toFixed(1);
-            return minutes + ":" + (seconds < 10 ? "0" : "") + seconds;
-        """)
+        # Offer the raw trace when some of it is left out
+        points = target_points(args)
 
-        script1, div1 = components(p1)
-
-    else:
-        strokes = pd.DataFrame()
-        script1 = ''
-        div1 = 'No stroke data found!'
+        if points is not None and count > points:
+            full_url = url_for('workout', **{**args.to_dict(), 'full': 1})
 
     max_select = ['id','date','distance','time','split','stroke_rate','workout_type','heart_rate.average','comments']
     selects = []
@@ -1309,112 +844,25 @@ def workout():
     # Filter headers based on `selects`
     filtered_headers = [headers_mapping[item] for item in selects]
 
+    for key in ('splits', 'intervals'):
+        for row in details[key]:
+            row['split'] = format_seconds((row['time'] / 10) / (row['distance'] / 500)) if row['time'] and row['distance'] else None
+            row['time'] = format_seconds(row['time'] / 10) if row['time'] else None
+
     return(render_template(
         template_name_or_list='workout.html',
-        script=[script1],
-        div=[div1],
-        df=strokes,
+        chart_url=chart_url, full_url=full_url, crsid=crsid,
         club = url_for('club'), home = url_for('index'), data_url = url_for('data'), plot=url_for('plot'),
-        headers=filtered_headers, data=resdict))
+        headers=filtered_headers, data=resdict,
+        splits=details['splits'], intervals=details['intervals']))
 
 # Updated for SQL
 @app.route('/club')
 def club():
-    crsids = session.execute(
-                                select(User.crsid).where(
-                                    not_(func.find_in_set('Inactive', User.tags))
-                                )
-                            ).scalars().all()
-    args = request.args
-
-    dfs = []
-
-    totaldist = 0
-    totaltime = 0
-
-    if 'from_date' in args and 'to_date' in args:
-        from_date = args.get('from_date')
-        to_date = args.get('to_date')
-
-    else:
-        from_date = datetime.strptime('2024-10-01', '%Y-%m-%d')
-        to_date = datetime.strptime('2025-06-30', '%Y-%m-%d')
-
-    for crsid in crsids:
-        logid = session.execute(select(User.logbookid).where(User.crsid == crsid)).scalar()
-
-        query = select(Workout).where(Workout.user_id == logid, Workout.type.in_(["rower", "dynamic", "slides"]))
-
-        userdf = pd.read_sql(query, engine)
-
-        userdf['date'] = pd.to_datetime(userdf['date'])
-        userdf['distance'] = pd.to_numeric(userdf['distance'], errors='coerce')
-
-        userdf = userdf[(userdf['date'] >= from_date) & (userdf['date'] <= to_date)]
-
-        tdf = pd.DataFrame({f'{crsid}_date': userdf['date'],
-                            f'{crsid}_distance': userdf['distance']})
-
-        tdf = tdf.sort_values(f'{crsid}_date')
-
-        dfs.append(tdf)
-
-        totaldist += userdf['distance'].sum()
-        totaltime += userdf['time'].sum()
-
-    totaltime = format_seconds(totaltime/10)
-
-    try:
-        clubdf = pd.concat(dfs, axis=0, ignore_index=True)
-    except:
-        return(render_template(
-        template_name_or_list='club.html',
-        script='',
-        div=['<p>No user data found! Make sure some data exists. </p>'], totaldist = 0, totaltime = 0,
-        clubdf = [],
-        club = url_for('club'), home = url_for('index'), data_url = url_for('data'), plot=url_for('plot')))
-
-    p1 = figure(height=350, sizing_mode='stretch_width', x_axis_type='datetime')
-
-    for crsid in crsids:
-        if f'{crsid}_date' not in clubdf:
-            continue
-
-        date=clubdf[f'{crsid}_date']
-        distance=clubdf[f'{crsid}_distance'].cumsum()
-        idcolor = session.execute(select(User.color).where(User.crsid == crsid)).scalar()
-        idname = session.execute(select(User.preferred_name).where(User.crsid == crsid)).scalar() + ' ' + session.execute(select(User.last_name).where(User.crsid == crsid)).scalar()
-
-        source = ColumnDataSource(data=dict(
-            x=date,
-            y=distance,
-            legend_label=[idname] * len(date)  # Repeat crsid for each data point
-        ))
-
-        p1.line(
-            x='x',
-            y='y',
-            source=source,
-            alpha=0.8,
-            line_width=3,
-            line_color=idcolor)
-
-
-    hover = HoverTool(tooltips=[
-        ('Name','@legend_label')
-    ], mode='mouse')
-
-    p1.add_tools(hover)
-
-    p1.yaxis.formatter = NumeralTickFormatter(format='0.0a')
-
-    script1, div1 = components(p1)
-
+    # Drawn in the browser from the JSON endpoint, which also fills in the totals
     return(render_template(
         template_name_or_list='club.html',
-        script=[script1],
-        div=[div1], totaldist = totaldist, totaltime = totaltime,
-        clubdf = clubdf,
+        chart_url=url_for('api.club', **request.args.to_dict()),
         club = url_for('club'), home = url_for('index'), data_url = url_for('data'), plot=url_for('plot')))
 
 @app.route('/forbidden')
@@ -1443,138 +891,10 @@ def forbidden():
 # Update for SQL
 @app.route('/pbs')
 def pbs():
-    crsid = auth_decorator.principal
-
-    file_path = f'dcbc/data/{crsid}'
-
-    logid = session.execute(select(User.logbookid).where(User.crsid == crsid)).scalar()
-
-    query = select(Workout).where(Workout.user_id == logid)
-
-    # Use pandas to read the query result into a DataFrame
-    df = pd.read_sql(query, engine)
-
-    df['date'] = pd.to_datetime(df['date'])
-    df['distance'] = pd.to_numeric(df['distance'], errors='coerce')
-
-    df['split'] = round((df['time'] / 10) / (df ['distance'] / 500),1)
-
-    df['split'] = df['split'].apply(format_seconds)
-
-    df['time_readable'] = (df['time']/10).apply(format_seconds)
-
-    df = df.sort_values("date")
-
-    two_ks = df[(df['workout_type'] == 'FixedDistanceSplits') & (df['distance'] == 2000)]
-    five_ks = df[(df['workout_type'] == 'FixedDistanceSplits') & (df['distance'] == 5000)]
-    thrtws = df[(df['workout_type'] == 'FixedTimeSplits') & (df['time'] == 18000) & (df['spm'] <= 21)]
-
-    if not two_ks.empty:
-
-        p1 = figure(height=350, sizing_mode='stretch_width', x_axis_type='datetime')
-
-        # Plot the second dataset on the right y-axis
-        p1.scatter(
-            x=two_ks['date'],
-            y=two_ks['time']/10,
-            color='black',
-            alpha=0.8)
-
-        time_array = two_ks['time'].values
-        keep_indices = np.where(np.r_[True, time_array[1:] < np.minimum.accumulate(time_array[:-1])])[0]
-
-        # Slice the DataFrame
-        pb_twos = two_ks.iloc[keep_indices].copy()
-
-        p1.line(
-            x=pb_twos['date'],
-            y=pb_twos['time']/10,
-            color='#bb0088',
-            alpha=0.8,
-            line_width=3)
-
-        p1.yaxis.formatter = FuncTickFormatter(code="""
-            var minutes = Math.floor(tick / 60);
-            var seconds = (tick % 60).toFixed(1);
-            return minutes + ":" + (seconds < 10 ? "0" : "") + seconds;
-        """)
-
-        script1, div1 = components(p1)
-    else:
-        script1 = ''
-        div1 = 'Log a 2K to see your PBs!'
-
-    if not five_ks.empty:
-
-        p2 = figure(height=350, sizing_mode='stretch_width', x_axis_type='datetime')
-
-        # Plot the second dataset on the right y-axis
-        p2.scatter(
-            x=five_ks['date'],
-            y=five_ks['time']/10,
-            color='black',
-            alpha=0.8)
-
-        time_array = five_ks['time'].values
-        keep_indices = np.where(np.r_[True, time_array[1:] < np.minimum.accumulate(time_array[:-1])])[0]
-
-        # Slice the DataFrame
-        pb_fives = five_ks.iloc[keep_indices].copy()
-
-        p2.line(
-            x=pb_fives['date'],
-            y=pb_fives['time']/10,
-            color='#bb0088',
-            alpha=0.8,
-            line_width=3)
-
-        p2.yaxis.formatter = FuncTickFormatter(code="""
-            var minutes = Math.floor(tick / 60);
-            var seconds = (tick % 60).toFixed(1);
-            return minutes + ":" + (seconds < 10 ? "0" : "") + seconds;
-        """)
-
-        script2, div2 = components(p2)
-
-    else:
-        script2 = ''
-        div2 = 'Log a 5K to see your PBs!'
-
-    if not thrtws.empty:
-
-        p3 = figure(height=350, sizing_mode='stretch_width', x_axis_type='datetime')
-
-        # Plot the second dataset on the right y-axis
-        p3.scatter(
-            x=thrtws['date'],
-            y=thrtws['distance'],
-            color='black',
-            alpha=0.8)
-
-        dist_array = thrtws['distance'].values
-        keep_indices = np.where(dist_array == np.maximum.accumulate(dist_array))[0]
-
-        # Slice the DataFrame
-        pb_thrtws = thrtws.iloc[keep_indices].copy()
-
-        p3.line(
-            x=pb_thrtws['date'],
-            y=pb_thrtws['distance'],
-            color='#bb0088',
-            alpha=0.8,
-            line_width=3)
-
-        script3, div3 = components(p3)
-
-    else:
-        script3 = ''
-        div3 = 'Log a 30r20 to see your PBs!'
-
+    # Drawn in the browser from the JSON endpoint
     return(render_template(
         template_name_or_list='pbs.html',
-        script=[script1, script2, script3],
-        div=[div1, div2, div3],
-        two_ks = two_ks, five_ks = five_ks, thrtws = thrtws,
+        chart_url=url_for('api.pbs'),
         club = url_for('club'), home = url_for('index'), data_url = url_for('data'), plot=url_for('plot')))
 
 @app.route('/commit_crews', methods=['POST'])
@@ -1760,6 +1080,8 @@ def submit_availability():
 
 @app.route('/planner', methods=['GET'])
 def planner():
+    import pandas as pd
+
     crsid = auth_decorator.principal
 
     try:
@@ -1802,10 +1124,13 @@ def delete_user():
         except:
             pass
 
+        tokens.delete(delid)
+
         logid = session.execute(select(User.logbookid).where(User.crsid == delid)).scalar()
 
         if logid is not None:
-            session.execute(delete(Workout).where(Workout.user_id == logid))
+            delete_workouts(session.execute(select(Workout.id).where(Workout.user_id == logid)).scalars().all())
+        session.execute(delete(SyncState).where(SyncState.crsid == delid))
         session.execute(delete(User).where(User.crsid == delid))
         session.commit()
 
@@ -1895,6 +1220,8 @@ def get_boat_info():
 
 @app.route('/check_availability', methods=['POST'])
 def check_availability():
+    import pandas as pd
+
     data = request.get_json()
     selected_date = data.get('date', '')
 
@@ -1949,6 +1276,8 @@ def find_crsid():
 
 @app.route('/outing')
 def view_outing():
+    import pandas as pd
+
 
     out_id = request.args.get('id')
 
@@ -2015,6 +1344,8 @@ def view_outing():
 
 @app.route('/outings', methods=['GET', 'POST'])
 def outings():
+    import pandas as pd
+
 
     if 'weekof' in request.args:
 
@@ -2152,6 +1483,8 @@ def outings():
 
 @app.route('/outings_summary', methods=['GET', 'POST'])
 def outings_summary():
+    import pandas as pd
+
 
     if 'weekof' in request.args:
 
@@ -2279,6 +1612,8 @@ def outings_summary():
 
 @app.route('/ergtable', methods=['GET', 'POST'])
 def group_ergs():
+    import numpy as np
+
     if request.method == 'POST':
         data = request.get_json()
 
@@ -2318,14 +1653,19 @@ def group_ergs():
 
         ergs = []
 
-        for erg in workouts:
+        # Format every split and time in one pass rather than row by row
+        times = np.array([erg.time for erg in workouts], dtype=np.float64)
+        splits = format_splits(times, np.array([erg.distance for erg in workouts], dtype=np.float64))
+        times = format_deciseconds(times)
+
+        for erg, split, erg_time in zip(workouts, splits, times):
             erg_dict = {key: value for key, value in vars(erg).items() if not key.startswith('_')}
             erg_dict = {
                 'user_id': log_names.get(erg_dict['user_id'], erg_dict['user_id']),
                 'type': erg_dict['type'],
                 'date': erg_dict['date'],
-                'split': format_seconds(round(((erg_dict['time']) / 10) / (erg_dict ['distance'] / 500),1)),
-                'time': format_seconds(erg_dict['time'] / 10) if 'time' in erg_dict else '',
+                'split': split,
+                'time': erg_time,
                 'distance': erg_dict['distance'],
                 'avghr': erg_dict['avghr'],
                 'workout_type': erg_dict['workout_type'],
@@ -2599,7 +1939,7 @@ app.config.update(
 app.static_folder = 'static'
 
 if __name__ == '__main__':
-    app.run(port=21389,host='0.0.0.0', debug=True)
+    create_app().run(port=21389,host='0.0.0.0', debug=True)
 
 @app.route('/favicon.ico')
 def favicon():
@@ -1,6 +1,8 @@
 import os
 import json
-import requests
+import argparse
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import create_engine, select
 import pandas as pd
 from datetime import datetime, timedelta
@@ -9,115 +11,114 @@ from dcbc.models.workout import Workout # Import from models.py
 from dcbc.models.usersdb import User
 
 from dcbc.project.session import session, engine
+from dcbc.project.ingest import ingest_results, handle_webhook_events
+from dcbc.project.ingest_queue import IngestQueue, drain
+from dcbc.project.prefetch import schedule_prefetch, prefetch_workouts, PREFETCH_BATCH
+from dcbc.project.concept2 import Concept2Client
+from dcbc.project.tokens import TokenStore
+from dcbc.project.token_refresh import refresh_expiring
+from dcbc.project.plot_cache import plot_cache
 from dcbc.project.auth_utils import load_secrets, setup_auth, load_users, get_decrypt_pass, auth_decorator, superuser_check
 
 secrets = load_secrets()
 
 # Configuration
 CLIENT_ID, CLIENT_SECRET, decryptkey, datacipher = setup_auth(secrets)
-TOKEN_URL = 'https://log.concept2.com/oauth/access_token'
-
-# Parameters (replace with actual workout ID for testing)
-start_time = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
-
-# Query to pull workout IDs from workouts since the start_time
-workout_datas = session.execute(
-    select(Workout.id).where(Workout.date >= start_time)
-).scalars().all()
-
-for workoutid in workout_datas:
-    # Fetch crsid from User table where logbookid matches the workoutid
-    workout_data = session.execute(select(Workout).where(Workout.id == workoutid)).scalar_one()
-
-    crsid_query = select(User.crsid).where(User.logbookid == workout_data.user_id)
-    crsid = session.execute(crsid_query).scalar()
-
-    if not crsid:
-        raise ValueError("No user found with the provided workout ID.")
-
-    # Paths
-    file_path = f'dcbc/data/{crsid}'
-    token_path = f'{file_path}/token.txt'
-    data_url = f"https://log.concept2.com/api/users/{workout_data.user_id}/results/{workoutid}"
-
-    # Check and load encrypted token
-    if os.path.exists(token_path):
-        with open(token_path, 'rb') as file:
-            encrypted_data = file.read()
-        token_data = json.loads(datacipher.decrypt(encrypted_data).decode())
-        try:
-            access_token = token_data['access_token']
-            refresh_token = token_data['refresh_token']
-        except:
-            print(token_data,crsid)
-            continue
-    else:
-        raise FileNotFoundError("Token file not found.")
-
-    # Make request to API
-    data_headers = {'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'}
-    response = requests.get(data_url, headers=data_headers)
-    try:
-        dataresponse = response.json()
-    except:
-       print(response)
-       continue
-
-    # Refresh token if necessary
-    if 'data' not in dataresponse:
-        token_params = {
-            'grant_type': 'refresh_token',
-            'client_id': CLIENT_ID,
-            'client_secret': CLIENT_SECRET,
-            'scope': 'user:read,results:read',
-            'refresh_token': refresh_token
-        }
-        response = requests.post(TOKEN_URL, data=token_params)
-        token_data = response.json()
-
-        # Encrypt and save refreshed token
-        encrypted_data = datacipher.encrypt(json.dumps(token_data).encode())
-        with open(token_path, 'wb') as file:
-            file.write(encrypted_data)
-
-        access_token = token_data['access_token']
-        data_headers = {'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'}
-        response = requests.get(data_url, headers=data_headers)
-        dataresponse = response.json()
-
-    # Extract and print workout data
+
+# Concurrent requests to Concept2 - override with --workers or DCBC_REFRESH_WORKERS
+DEFAULT_WORKERS = int(os.environ.get('DCBC_REFRESH_WORKERS', 8))
+
+# Fetch a single result - the token comes from the store's cache, and is refreshed once if it has expired
+def fetch_result(concept2, crsid, logbookid, workoutid):
+    dataresponse = concept2.get(crsid, f'users/{logbookid}/results/{workoutid}')
+
     if 'data' in dataresponse:
-        res = dataresponse['data']
-
-        filtered_workout_data = {
-            "id": res.get("id"),
-            "user_id": res.get("user_id"),
-            "date": res.get("date", None),  # Use None as a default
-            "distance": res.get("distance", None),
-            "type": res.get("type", None),
-            "workout_type": res.get("workout_type", None),
-            "time": res.get("time", None),
-            "spm": res.get("stroke_rate", None),
-            "avghr": res.get("heart_rate", {}).get("average", None),
-            "comments": res.get("comments", None),    # If missing, default to None
-            "stroke_data": res.get("stroke_data", False),
-            "rest_time": res.get("rest_time", 0)
-        }
-
-        # Convert date string to datetime object if it's not None
-        if filtered_workout_data["date"]:
-            filtered_workout_data["date"] = datetime.strptime(filtered_workout_data["date"], "%Y-%m-%d %H:%M:%S")
-
-        # Create Workout object with the filtered data
-        new_workout = Workout(**filtered_workout_data)
-
-        # Add to session
-        session.merge(new_workout)
-
-        # Commit all inserts to the database
-        session.commit()
-
-    else:
-        print(f"Error - response status: {dataresponse.get('status_code', 'unknown')}, response: {dataresponse}")
-
-session.close()
+        return dataresponse['data']
+
+    print(f"Error - response status: {dataresponse.get('status_code', 'unknown')}, response: {dataresponse}")
+    return None
+
+# Group the workouts logged since start_time by the user who owns them, in one joined query
+def build_work_list(start_time):
+    rows = session.execute(
+        select(Workout.id, Workout.user_id, User.crsid)
+        .outerjoin(User, User.logbookid == Workout.user_id)
+        .where(Workout.date >= start_time)
+    ).all()
+
+    work = {}
+
+    for workoutid, logbookid, crsid in rows:
+        if not crsid:
+            print(f"No user found for workout {workoutid}, skipping")
+            continue
+
+        work.setdefault((crsid, logbookid), []).append(workoutid)
+
+    return work
+
+def refresh(concept2, start_time, workers=DEFAULT_WORKERS):
+    work = build_work_list(start_time)
+
+    # Renew any token that is about to lapse in one concurrent batch, rather than one failed GET at a time
+    renewed, failed = refresh_expiring(concept2, limit=None, workers=workers)
+    if renewed or failed:
+        print(f"Renewed {renewed} tokens ahead of expiry ({failed} failed)")
+
+    # Load each user's token once, up front - later reads are served from the store's cache
+    tokens = set()
+    for crsid, logbookid in work:
+        token_data = concept2.load_token(crsid)
+
+        if token_data is None or 'access_token' not in token_data:
+            print(f"No usable token for {crsid}, skipping")
+            continue
+
+        tokens.add(crsid)
+
+    jobs = [
+        (crsid, logbookid, workoutid)
+        for (crsid, logbookid), workoutids in work.items() if crsid in tokens
+        for workoutid in workoutids
+    ]
+
+    # Fetch every result concurrently, bounded by the worker count
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(lambda job: fetch_result(concept2, *job), jobs))
+
+    refreshed_results = [result for result in results if result is not None]
+
+    # Write all refreshed workouts, with their splits and intervals, in one go
+    refreshed_workouts = ingest_results(refreshed_results)
+    session.commit()
+
+    print(f"Refreshed {len(refreshed_workouts)} of {len(jobs)} workouts for {len(tokens)} users")
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-sync recently logged workouts from Concept2')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help='maximum number of concurrent Concept2 requests (1 runs serially)')
+    parser.add_argument('--days', type=int, default=1,
+                        help='how many days back to refresh')
+    cli_args = parser.parse_args()
+
+    # Connection pool sized to the worker count actually in use, so no thread waits on or discards a connection
+    concept2 = Concept2Client(CLIENT_ID, CLIENT_SECRET, TokenStore(datacipher), pool_size=max(cli_args.workers, 10))
+
+    # Parameters
+    start_time = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=cli_args.days)
+
+    # Pick up any webhook events and prefetches the web workers have not got to yet
+    ingest_queue = IngestQueue()
+    drain(ingest_queue, {'webhook': lambda events: schedule_prefetch(ingest_queue, handle_webhook_events(events))})
+    drain(ingest_queue, {'prefetch': partial(prefetch_workouts, concept2)}, limit=PREFETCH_BATCH)
+
+    refresh(concept2, start_time, workers=cli_args.workers)
+
+    # Cached charts are keyed by data version, so old ones are never read again - clear them out
+    print(f"Pruned {plot_cache.prune()} expired cached charts")
+
+    session.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import argparse
+
+from dcbc.models.base import Base
+
+# Every model, so Base.metadata knows about every table
+from dcbc.models.workout import Workout
+from dcbc.models.usersdb import User
+from dcbc.models.boatsdb import Boat
+from dcbc.models.dailydb import Daily
+from dcbc.models.eventdb import Event
+from dcbc.models.outings import Outing
+from dcbc.models.hoursdb import Hourly
+from dcbc.models.syncdb import SyncState
+from dcbc.models.strokedb import StrokeData
+from dcbc.models.splitsdb import WorkoutSplit, WorkoutInterval
+from dcbc.models.tokendb import Token
+from dcbc.models.schemadb import SchemaVersion
+from dcbc.models.totalsdb import DailyTotal
+from dcbc.models.pbdb import PersonalBest, PBEvent
+from dcbc.models.versiondb import DataVersion
+
+from dcbc.project.session import session, engine
+from dcbc.project.totals import rebuild_daily_totals
+from dcbc.project.pbs import rebuild_pbs
+from dcbc.project.migrations import migrate, current_version
+
+# Create any missing tables - existing tables are left as they are
+def init_db():
+    Base.metadata.create_all(engine)
+    print(f"Database ready ({len(Base.metadata.tables)} tables)")
+
+# Bring an existing database up to date - new tables, then any pending migrations
+def run_migrations():
+    applied = migrate(engine)
+    print(f"Applied {len(applied)} migrations, schema is at version {current_version(engine)}")
+
+# Recompute daily_totals from scratch, e.g. after editing workouts by hand
+def rebuild_totals():
+    rebuild_daily_totals()
+    session.commit()
+    print("Daily totals rebuilt")
+
+# Recompute the PB index from scratch
+def rebuild_personal_bests():
+    rebuild_pbs()
+    session.commit()
+    print("Personal bests rebuilt")
+
+def show_version():
+    print(f"Schema version {current_version(engine)}")
+
+COMMANDS = {
+    'init-db': init_db,
+    'migrate': run_migrations,
+    'version': show_version,
+    'rebuild-totals': rebuild_totals,
+    'rebuild-pbs': rebuild_personal_bests
+}
+
+# Run from the parent directory, e.g. `python -m dcbc.manage migrate`
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='DCBC maintenance commands')
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    cli_args = parser.parse_args()
+
+    COMMANDS[cli_args.command]()
@@ -1,11 +1,17 @@
 import uuid
-from sqlalchemy import Column, String, Text, Boolean, DateTime, JSON, Integer
+from sqlalchemy import Column, String, Text, Boolean, DateTime, JSON, Integer, Index
 from dcbc.models.base import Base  # Import the shared Base
 
 # Define the table structure with only the required columns
 class Outing(Base):
     __tablename__ = 'outings'
 
+    # Added to existing databases by project/migrations.py
+    __table_args__ = (
+        Index('ix_outings_date_time', 'date_time'),
+        Index('ix_outings_boat_name', 'boat_name'),
+    )
+
     outing_id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()), unique=True, nullable=False)
     date_time = Column(DateTime)
     boat_name = Column(String(255))
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from dcbc.models.base import Base  # Import the shared Base
+
+# Each user's current best for each standard piece (see project/pbs.py)
+class PersonalBest(Base):
+    __tablename__ = 'personal_bests'
+
+    user_id = Column(Integer, primary_key=True)
+    piece = Column(String(15), primary_key=True)
+
+    workout_id = Column(Integer)
+    date = Column(DateTime)
+    time = Column(Integer)
+    distance = Column(Integer)
+
+# Every result that was a new best for its piece when it was rowed - the PB progression
+class PBEvent(Base):
+    __tablename__ = 'pb_events'
+
+    workout_id = Column(Integer, primary_key=True)
+    piece = Column(String(15), primary_key=True)
+
+    user_id = Column(Integer, index=True)
+
+    date = Column(DateTime)
+    time = Column(Integer)
+    distance = Column(Integer)
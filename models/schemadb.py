@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from dcbc.models.base import Base  # Import the shared Base
+
+# One row per schema migration applied to this database
+class SchemaVersion(Base):
+    __tablename__ = 'schema_version'
+
+    version = Column(Integer, primary_key=True)
+    name = Column(String(255))
+
+    applied_at = Column(DateTime)
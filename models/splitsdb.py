@@ -0,0 +1,45 @@
+from sqlalchemy import Column, Integer, String
+from dcbc.models.base import Base  # Import the shared Base
+
+# Per-split breakdown of a workout, as logged by the monitor
+class WorkoutSplit(Base):
+    __tablename__ = 'workout_splits'
+
+    workout_id = Column(Integer, primary_key=True)
+    number = Column(Integer, primary_key=True)
+
+    user_id = Column(Integer, index=True)
+
+    type = Column(String(31))
+    time = Column(Integer)
+    distance = Column(Integer)
+    calories = Column(Integer)
+    stroke_rate = Column(Integer)
+
+    hr_min = Column(Integer)
+    hr_avg = Column(Integer)
+    hr_max = Column(Integer)
+    hr_ending = Column(Integer)
+
+# Per-interval breakdown of an interval workout, including the rest after each piece
+class WorkoutInterval(Base):
+    __tablename__ = 'workout_intervals'
+
+    workout_id = Column(Integer, primary_key=True)
+    number = Column(Integer, primary_key=True)
+
+    user_id = Column(Integer, index=True)
+
+    type = Column(String(31))
+    time = Column(Integer)
+    distance = Column(Integer)
+    calories = Column(Integer)
+    stroke_rate = Column(Integer)
+
+    rest_time = Column(Integer)
+    rest_distance = Column(Integer)
+
+    hr_min = Column(Integer)
+    hr_avg = Column(Integer)
+    hr_max = Column(Integer)
+    hr_ending = Column(Integer)
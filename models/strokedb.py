@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, LargeBinary
+from dcbc.models.base import Base  # Import the shared Base
+
+# Stroke-by-stroke data for a workout, stored as packed little-endian int32 arrays
+class StrokeData(Base):
+    __tablename__ = 'stroke_data'
+
+    workout_id = Column(Integer, primary_key=True)
+    count = Column(Integer)
+
+    # length pushes MySQL to MEDIUMBLOB so marathon-length pieces still fit
+    t = Column(LargeBinary(length=16777215))
+    d = Column(LargeBinary(length=16777215))
+    p = Column(LargeBinary(length=16777215))
+    spm = Column(LargeBinary(length=16777215))
+    hr = Column(LargeBinary(length=16777215))
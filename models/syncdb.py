@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from dcbc.models.base import Base  # Import the shared Base
+
+# High-water mark of the newest logbook workout synced for each user
+class SyncState(Base):
+    __tablename__ = 'sync_state'
+
+    crsid = Column(String(15), primary_key=True)
+
+    last_date = Column(DateTime)
+    last_id = Column(Integer)
+
+    synced_at = Column(DateTime)
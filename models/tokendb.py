@@ -0,0 +1,17 @@
+from sqlalchemy import Column, String, DateTime, Integer, LargeBinary
+from dcbc.models.base import Base  # Import the shared Base
+
+# Concept2 OAuth tokens, Fernet-encrypted with the app data key
+class Token(Base):
+    __tablename__ = 'tokens'
+
+    crsid = Column(String(15), primary_key=True)
+
+    data = Column(LargeBinary)
+
+    expires_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+    # Failed background refreshes in a row, and when the refresher may next try this token
+    refresh_failures = Column(Integer, nullable=False, default=0, server_default='0')
+    retry_after = Column(DateTime)
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String, Date
+from dcbc.models.base import Base  # Import the shared Base
+
+# Metres, time and session count per user per day per erg type, kept in step with workouts at ingest
+class DailyTotal(Base):
+    __tablename__ = 'daily_totals'
+
+    user_id = Column(Integer, primary_key=True)
+    date = Column(Date, primary_key=True)
+    type = Column(String(255), primary_key=True)
+
+    distance = Column(Integer)
+    time = Column(Integer)
+    count = Column(Integer)
@@ -1,10 +1,15 @@
-from sqlalchemy import Column, Integer, String, Boolean, Text
+from sqlalchemy import Column, Integer, String, Boolean, Text, Index
 from dcbc.models.base import Base  # Import the shared Base
 
 # Define the table structure with only the required columns
 class User(Base):
     __tablename__ = 'users'
 
+    # Added to existing databases by project/migrations.py
+    __table_args__ = (
+        Index('ix_users_logbookid', 'logbookid'),
+    )
+
     crsid = Column(String(15), primary_key=True)
     first_name = Column(String(255))
     last_name = Column(String(255))
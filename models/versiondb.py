@@ -0,0 +1,11 @@
+from sqlalchemy import Column, String, DateTime
+from dcbc.models.base import Base  # Import the shared Base
+
+# Changes whenever the workouts behind a scope ('user:<logbookid>' or 'club') change - used to key cached charts
+class DataVersion(Base):
+    __tablename__ = 'data_versions'
+
+    scope = Column(String(31), primary_key=True)
+    version = Column(String(32))
+
+    updated_at = Column(DateTime)
@@ -1,10 +1,17 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index
 from dcbc.models.base import Base  # Import the shared Base
 
 # Define the table structure with only the required columns
 class Workout(Base):
     __tablename__ = 'workouts'
 
+    # Added to existing databases by project/migrations.py
+    __table_args__ = (
+        Index('ix_workouts_user_date', 'user_id', 'date'),
+        Index('ix_workouts_user_piece', 'user_id', 'distance', 'workout_type', 'time'),
+        Index('ix_workouts_user_time', 'user_id', 'time'),
+    )
+
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer)
     date = Column(DateTime)
@@ -0,0 +1,160 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from dcbc.project.session import session
+from dcbc.project.ingest import ingest_results
+
+# Windows fetched at once for one user
+BACKFILL_WORKERS = 4
+
+# Size of each date window - a busy season fits in a few pages
+WINDOW_DAYS = 120
+
+# Windows are sized from how densely the first page is spread, to hold about this many pages each, within these bounds
+WINDOW_PAGES = 2
+MIN_WINDOW_DAYS = 30
+MAX_WINDOW_DAYS = 365
+
+# Stop going back once this many days in a row come back empty - nobody's logbook has a longer gap
+MAX_GAP_DAYS = 2 * 365
+
+# Results Concept2 returns per page
+PAGE_SIZE = 50
+
+# Split [from_date, to_date] into consecutive windows of `days`
+# Neighbouring windows share their boundary day so nothing logged on it is missed - duplicates are dropped later
+def date_windows(from_date, to_date, days=WINDOW_DAYS):
+    start = datetime.strptime(from_date, '%Y-%m-%d')
+    end = datetime.strptime(to_date, '%Y-%m-%d')
+
+    windows = []
+    while start < end:
+        stop = min(start + timedelta(days=days), end)
+        windows.append((start.strftime('%Y-%m-%d'), stop.strftime('%Y-%m-%d')))
+        start = stop
+
+    return windows or [(from_date, to_date)]
+
+# Window size for a logbook whose newest full page runs from newest to oldest (Concept2 date strings)
+def window_days(newest, oldest):
+    span = (datetime.strptime(newest[:10], '%Y-%m-%d') - datetime.strptime(oldest[:10], '%Y-%m-%d')).days
+
+    return min(max(span * WINDOW_PAGES, MIN_WINDOW_DAYS), MAX_WINDOW_DAYS)
+
+def window_length(window):
+    return (datetime.strptime(window[1][:10], '%Y-%m-%d') - datetime.strptime(window[0][:10], '%Y-%m-%d')).days
+
+# The newest page of results between two dates
+def fetch_page(concept2, crsid, page_from, page_to):
+    dataresponse = concept2.get(crsid, 'users/me/results', params={'from': page_from, 'to': page_to})
+
+    if 'data' not in dataresponse:
+        raise RuntimeError(f'response is {dataresponse.get("status_code")}, expected 200')
+
+    return dataresponse['data']
+
+# Fetch one window, newest first, paging backwards until a short page comes back
+def fetch_window(concept2, crsid, window, emit):
+    window_from, window_to = window
+
+    page_to = window_to
+
+    while True:
+        page = fetch_page(concept2, crsid, window_from, page_to)
+
+        emit(page)
+
+        if len(page) < PAGE_SIZE:
+            return
+
+        oldest = page[-1].get('date')
+
+        # A whole page on one timestamp would loop forever
+        if oldest == page_to:
+            return
+
+        page_to = oldest
+
+# Pull a user's logbook between two dates
+# The newest page over the whole range comes first - most syncs end there, in one call. Only when it is full
+# is the older part split into windows, sized from that page, and fetched `workers` at a time, newest first.
+# Going back stops after MAX_GAP_DAYS of empty windows, so a sync from the default 2000-01-01 does not walk every
+# year since. Pages are de-duplicated by result id and written as they arrive; returns the filtered workouts stored
+def backfill(concept2, crsid, from_date, to_date=None, workers=BACKFILL_WORKERS):
+    if to_date is None:
+        to_date = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+
+    first_page = fetch_page(concept2, crsid, from_date, to_date)
+
+    seen = {result.get('id') for result in first_page}
+    stored = ingest_results(first_page) if first_page else []
+    session.commit()
+
+    if len(first_page) < PAGE_SIZE:
+        return stored
+
+    # Everything up to the oldest result on the first page - that result's timestamp closes the newest window
+    newest, oldest = first_page[0].get('date'), first_page[-1].get('date')
+
+    windows = date_windows(from_date, oldest[:10], days=window_days(newest, oldest))
+    windows[-1] = (windows[-1][0], oldest)
+    windows.reverse()
+
+    workers = max(1, workers)
+
+    # Fetch threads hand (window, page) pairs to this thread, which owns the database session
+    pages = queue.Queue()
+    done = object()
+
+    def run_window(window):
+        try:
+            fetch_window(concept2, crsid, window, lambda page: pages.put((window, page)))
+        except Exception as e:
+            pages.put((window, e))
+        finally:
+            pages.put((window, done))
+
+    error = None
+    empty_days = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(windows), workers):
+            batch = windows[start:start + workers]
+            found = dict.fromkeys(batch, 0)
+
+            for window in batch:
+                pool.submit(run_window, window)
+
+            remaining = len(batch)
+            while remaining:
+                window, page = pages.get()
+
+                if page is done:
+                    remaining -= 1
+                    continue
+
+                if isinstance(page, Exception):
+                    error = error or page
+                    continue
+
+                found[window] += len(page)
+
+                new_results = [result for result in page if result.get('id') not in seen]
+                seen.update(result.get('id') for result in new_results)
+
+                if new_results:
+                    stored += ingest_results(new_results)
+                    session.commit()
+
+            if error is not None:
+                raise error
+
+            # Newest to oldest, counting the days since the last window that had anything in it
+            for window in batch:
+                empty_days = empty_days + window_length(window) if found[window] == 0 else 0
+
+            if empty_days >= MAX_GAP_DAYS:
+                break
+
+    return stored
@@ -0,0 +1,110 @@
+from dcbc.project.queries import workouts_frame
+from dcbc.project.club import club_totals, CLUB_TYPES
+from dcbc.project.pbs import user_progression
+from dcbc.project.strokes import load_strokes
+from dcbc.project.downsample import lttb
+from dcbc.project.utils import format_seconds, format_splits
+
+# Bumped whenever a payload's shape changes, alongside the /api/v<n> prefix that serves it
+CHART_API_VERSION = 1
+
+# The PB charts: piece name in the index, and whether it is raced for time or for distance
+PB_CHARTS = (('2k', 'time'), ('5k', 'time'), ('30r20', 'distance'))
+
+# Dates as milliseconds since the epoch - what BokehJS puts on a datetime axis
+def epoch_ms(values):
+    import numpy as np
+
+    return np.asarray(values, dtype='datetime64[ms]').astype(np.int64).tolist()
+
+# A numeric column as a plain list, with gaps as None so the JSON stays valid
+def column(values):
+    import numpy as np
+
+    values = np.asarray(values, dtype=np.float64)
+    return [None if np.isnan(value) else value for value in values.tolist()]
+
+# /plot - running distance over the window, plus each day's pieces stacked as bars
+def plot_payload(user_id, from_date, to_date):
+    df = workouts_frame(user_id, ['id', 'date', 'distance', 'time'], from_date, to_date, types=['rower'])
+
+    day = df['date'].dt.floor('D')
+    top = df.groupby(day)['distance'].cumsum()
+
+    return {
+        'id': df['id'].tolist(),
+        'date': epoch_ms(df['date']),
+        'distance': column(df['distance']),
+        'cumulative': column(df['distance'].cumsum()),
+        'day': epoch_ms(day),
+        'top': column(top),
+        'base': column(top - df['distance']),
+        'split': format_splits(df['time'], df['distance']).tolist()
+    }
+
+# /pbs - every attempt at each piece, and the PB line from the progression index
+def pbs_payload(user_id):
+    df = workouts_frame(user_id, ['date', 'distance', 'time', 'spm', 'workout_type'],
+                        workout_types=['FixedDistanceSplits', 'FixedTimeSplits'])
+
+    attempts = {
+        '2k': df[(df['workout_type'] == 'FixedDistanceSplits') & (df['distance'] == 2000)],
+        '5k': df[(df['workout_type'] == 'FixedDistanceSplits') & (df['distance'] == 5000)],
+        '30r20': df[(df['workout_type'] == 'FixedTimeSplits') & (df['time'] == 18000) & (df['spm'] <= 21)]
+    }
+
+    payload = {}
+
+    for piece, measure in PB_CHARTS:
+        progression = user_progression(user_id, piece)
+
+        # Times are drawn in seconds, distances in metres
+        if measure == 'time':
+            values, pb_values = attempts[piece]['time'] / 10, [event.time / 10 for event in progression]
+        else:
+            values, pb_values = attempts[piece]['distance'], [event.distance for event in progression]
+
+        payload[piece] = {
+            'measure': measure,
+            'attempts': {'date': epoch_ms(attempts[piece]['date']), 'value': column(values)},
+            'pbs': {'date': epoch_ms([event.date for event in progression]), 'value': column(pb_values)}
+        }
+
+    return payload
+
+# /club and the coaches' view - each member's running distance, thinned to `points`, and the club totals
+def club_payload(from_date, to_date, points, types=CLUB_TYPES):
+    totals = club_totals(from_date, to_date, types=types)
+
+    members = []
+
+    for member in totals['members']:
+        keep = lttb(member['dates'], member['distance'], points)
+
+        members.append({
+            'name': member['name'],
+            'color': member['color'],
+            'date': epoch_ms(member['dates'][keep]),
+            'distance': member['distance'][keep].tolist()
+        })
+
+    return {'members': members, 'totaldist': totals['distance'], 'totaltime': format_seconds(totals['time'] / 10)}
+
+# /workout - pace and stroke rate against time in seconds, each thinned to `points`; None if no strokes are stored
+def strokes_payload(workout_id, points):
+    strokes = load_strokes(workout_id)
+
+    if strokes is None:
+        return None
+
+    pace = strokes.iloc[lttb(strokes['t'], strokes['p'], points)]
+    rate = strokes.iloc[lttb(strokes['t'], strokes['spm'], points)]
+
+    return {
+        'pace': {'t': (pace['t'] / 10).tolist(), 'p': (pace['p'] / 10).tolist()},
+        'rate': {'t': (rate['t'] / 10).tolist(), 'spm': rate['spm'].tolist()},
+        # Axis ranges come from every stroke, so thinning never changes the scale
+        'pace_range': [int(strokes['p'].min()) / 10, int(strokes['p'].max()) / 10],
+        'spm_max': int(strokes['spm'].max()),
+        'count': len(strokes)
+    }
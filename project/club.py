@@ -0,0 +1,58 @@
+from sqlalchemy import select, func, not_
+
+from dcbc.models.totalsdb import DailyTotal
+from dcbc.models.usersdb import User
+from dcbc.project.session import session
+from dcbc.project.queries import to_datetime
+
+# Erg types counted on the club leaderboard
+CLUB_TYPES = ('rower', 'dynamic', 'slides')
+
+# Per-member running distance over a date window, for the club leaderboards
+# Reads the pre-aggregated daily_totals rows for active members in one query, whatever the size of the club
+# Returns {'members': [{'crsid', 'name', 'color', 'dates', 'distance'}], 'distance': total, 'time': total deciseconds},
+# with each member's dates (datetime64) and cumulative daily distance (int64) ready to hand to a plot
+def club_totals(from_date, to_date, types=CLUB_TYPES):
+    import numpy as np
+
+    rows = session.execute(
+        select(
+            User.crsid, User.preferred_name, User.last_name, User.color, DailyTotal.date,
+            func.sum(DailyTotal.distance).label('distance'),
+            func.sum(DailyTotal.time).label('time')
+        )
+        .join(User, User.logbookid == DailyTotal.user_id)
+        .where(
+            not_(func.find_in_set('Inactive', User.tags)),
+            DailyTotal.type.in_(types),
+            DailyTotal.date >= to_datetime(from_date).date(),
+            DailyTotal.date <= to_datetime(to_date).date()
+        )
+        .group_by(User.crsid, User.preferred_name, User.last_name, User.color, DailyTotal.date)
+        .order_by(User.crsid, DailyTotal.date)
+    ).all()
+
+    members = {}
+    totaldist = 0
+    totaltime = 0
+
+    for crsid, preferred_name, last_name, color, row_day, distance, time in rows:
+        member = members.setdefault(crsid, {
+            'crsid': crsid,
+            'name': f'{preferred_name} {last_name}',
+            'color': color,
+            'dates': [],
+            'distance': []
+        })
+
+        member['dates'].append(str(row_day))
+        member['distance'].append(int(distance or 0))
+
+        totaldist += int(distance or 0)
+        totaltime += int(time or 0)
+
+    for member in members.values():
+        member['dates'] = np.array(member['dates'], dtype='datetime64[D]')
+        member['distance'] = np.cumsum(np.array(member['distance'], dtype=np.int64))
+
+    return {'members': list(members.values()), 'distance': totaldist, 'time': totaltime}
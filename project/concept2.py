@@ -0,0 +1,151 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Concept2 logbook endpoints
+API_URL = 'https://log.concept2.com/api'
+AUTH_URL = 'https://log.concept2.com/oauth/authorize'
+TOKEN_URL = 'https://log.concept2.com/oauth/access_token'
+USER_URL = f'{API_URL}/users/me'
+
+SCOPE = 'user:read,results:read'
+
+# (connect, read) timeouts in seconds for every call to Concept2
+TIMEOUT = (5, 30)
+
+# Concept2 answers an expired or revoked access token with a 401, or an OAuth invalid_token error
+def token_rejected(dataresponse):
+    return dataresponse.get('status_code') == 401 or dataresponse.get('error') == 'invalid_token'
+
+# Shared client for the Concept2 API
+# One pooled keep-alive session, retries with exponential backoff on 5xx and timeouts,
+# and a single place that refreshes an expired token and retries the request
+class Concept2Client:
+    def __init__(self, client_id, client_secret, tokens, retries=3, backoff=0.5, pool_size=10, timeout=TIMEOUT):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.tokens = tokens
+        self.timeout = timeout
+
+        # Only GETs are retried - replaying a token POST could burn a refresh token
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False
+        )
+
+        self.http = requests.Session()
+        self.http.mount('https://', HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size))
+
+        # One lock per crsid so concurrent callers in this process refresh a token only once
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock_for(self, crsid):
+        with self._locks_guard:
+            return self._locks.setdefault(crsid, threading.Lock())
+
+    # Decrypted token for a user, None if they have not authorised yet
+    def load_token(self, crsid, fresh=False):
+        return self.tokens.get(crsid, fresh=fresh)
+
+    # Store a new token for a user
+    def save_token(self, crsid, token_data):
+        self.tokens.put(crsid, token_data)
+
+    def has_token(self, crsid):
+        return self.tokens.has(crsid)
+
+    def _post_token(self, token_params):
+        try:
+            response = self.http.post(TOKEN_URL, data=token_params, timeout=self.timeout)
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            return {'status_code': 503, 'message': str(e)}
+
+    # Swap an OAuth authorisation code for a token
+    def exchange_code(self, code, redirect_uri):
+        return self._post_token({
+            'grant_type': 'authorization_code',
+            'code': f'{code}',
+            'redirect_uri': redirect_uri,
+            'client_id': self.client_id,
+            'client_secret': self.client_secret
+        })
+
+    # Refresh a user's token and store it, returning the new token (None on failure)
+    # If another caller already replaced the stale token, the stored one is returned without a second refresh
+    # The in-process lock keeps threads here from queueing on the database; the store's row lock covers other processes
+    # `ahead` skips the refresh if the stored token no longer runs out within that many seconds (see TokenStore.refresh)
+    def refresh_token(self, crsid, stale_token=None, ahead=None):
+        def renew(token_data):
+            if 'refresh_token' not in token_data:
+                return None
+
+            new_token = self._post_token({
+                'grant_type': 'refresh_token',
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+                'scope': SCOPE,
+                'refresh_token': token_data['refresh_token']
+            })
+
+            if 'access_token' not in new_token:
+                print(f"Token refresh failed for {crsid}: {new_token}")
+                return None
+
+            return new_token
+
+        with self._lock_for(crsid):
+            return self.tokens.refresh(crsid, renew, stale_token=stale_token, ahead=ahead)
+
+    def _get(self, url, access_token, params=None):
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        }
+
+        try:
+            response = self.http.get(url, headers=headers, params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            return {'status_code': 503, 'message': str(e)}
+
+        try:
+            body = response.json()
+        except ValueError:
+            return {'status_code': response.status_code, 'message': response.text}
+
+        # Make sure every error carries its HTTP status, so callers can tell a rejected token from anything else
+        if not response.ok and isinstance(body, dict):
+            body.setdefault('status_code', response.status_code)
+
+        return body
+
+    # GET an API path (relative to /api, e.g. 'users/me/results') on behalf of a user
+    # Refreshes the token and retries once if Concept2 rejects it; every other error is returned as it came
+    # Always returns a dict - errors look like Concept2's own {'status_code': ..., 'message': ...}
+    def get(self, crsid, path, params=None, token=None):
+        url = f"{API_URL}/{path.lstrip('/')}"
+
+        token_data = token if token is not None else self.load_token(crsid)
+
+        if token_data is None or 'access_token' not in token_data:
+            token_data = self.refresh_token(crsid)
+
+            if token_data is None:
+                return {'status_code': 401, 'message': f'No token stored for {crsid}'}
+
+        dataresponse = self._get(url, token_data['access_token'], params)
+
+        # Rate limits and server errors are not token problems - refreshing for them would only rotate the token
+        if token_rejected(dataresponse):
+            new_token = self.refresh_token(crsid, stale_token=token_data)
+
+            if new_token is not None:
+                dataresponse = self._get(url, new_token['access_token'], params)
+
+        return dataresponse
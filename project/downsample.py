@@ -0,0 +1,69 @@
+# Charts stretch to the page, so this is the width assumed when the page does not send ?width=
+DEFAULT_WIDTH = 1200
+
+# Bounds on a requested width, so a bad ?width= can neither blank a chart nor undo the downsampling
+MIN_WIDTH = 200
+MAX_WIDTH = 4000
+
+# Points to draw per series for this request - about one per pixel of chart width
+# None means full resolution, asked for with ?full=1
+def target_points(args, default=DEFAULT_WIDTH):
+    if args.get('full', '').lower() in ('1', 'true', 'yes'):
+        return None
+
+    try:
+        width = int(args.get('width', default))
+    except ValueError:
+        width = default
+
+    return min(max(width, MIN_WIDTH), MAX_WIDTH)
+
+# Indices of the points to keep when drawing y against x with at most `points` points,
+# by largest-triangle-three-buckets: the first and last points stay, and each bucket in between
+# keeps the point making the biggest triangle with the last point kept and the next bucket's average
+# Peaks, troughs and the overall shape survive, which plain striding would lose
+# x must be sorted; dates work too (they are compared as integers)
+def lttb(x, y, points):
+    import numpy as np
+
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype(np.int64)
+
+    x = x.astype(np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+
+    if points is None or points >= n or points < 3:
+        return np.arange(n)
+
+    # points - 2 buckets of (almost) equal size between the first and last point
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+
+    indices = np.empty(points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    kept = 0
+
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+
+        # The last bucket looks ahead to the final point itself
+        if bucket + 2 < len(edges):
+            next_start, next_end = end, edges[bucket + 2]
+            next_x = x[next_start:next_end].mean()
+            next_y = y[next_start:next_end].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+
+        # Twice the triangle areas - only the largest matters
+        areas = np.abs(
+            (x[kept] - next_x) * (y[start:end] - y[kept])
+            - (x[kept] - x[start:end]) * (next_y - y[kept])
+        )
+
+        kept = start + int(np.argmax(areas))
+        indices[bucket + 1] = kept
+
+    return indices
@@ -0,0 +1,194 @@
+from datetime import datetime
+
+from sqlalchemy import delete, insert, select
+
+from dcbc.models.workout import Workout
+from dcbc.models.splitsdb import WorkoutSplit, WorkoutInterval
+from dcbc.models.strokedb import StrokeData
+from dcbc.project.session import session, upsert
+from dcbc.project.totals import day_keys, stored_day_keys, refresh_daily_totals
+from dcbc.project.pbs import event_keys, update_pbs, recompute_pbs
+from dcbc.project.versions import bump_versions
+
+# Rows sent per multi-row INSERT - keeps each statement well under max_allowed_packet
+CHUNK_SIZE = 500
+
+# Pull the columns stored in the Workout table out of a Concept2 result
+def filter_workout(workout_data):
+    filtered_workout_data = {
+        "id": workout_data.get("id"),
+        "user_id": workout_data.get("user_id"),
+        "date": workout_data.get("date", None),  # Use None as a default
+        "distance": workout_data.get("distance", None),
+        "type": workout_data.get("type", None),
+        "workout_type": workout_data.get("workout_type", None),
+        "time": workout_data.get("time", None),
+        "spm": workout_data.get("stroke_rate", None),
+        "avghr": (workout_data.get("heart_rate") or {}).get("average", None),
+        "comments": workout_data.get("comments", None),    # If missing, default to None
+        "stroke_data": workout_data.get("stroke_data", False),
+        "rest_time": workout_data.get("rest_time", 0)
+    }
+
+    # Convert date string to datetime object if it's not None
+    if filtered_workout_data["date"]:
+        filtered_workout_data["date"] = datetime.strptime(filtered_workout_data["date"], "%Y-%m-%d %H:%M:%S")
+
+    return filtered_workout_data
+
+# Insert or update a batch of filtered workouts with one statement per chunk
+# MySQL gets INSERT ... ON DUPLICATE KEY UPDATE, SQLite gets INSERT ... ON CONFLICT, anything else falls back to merging
+def bulk_upsert_workouts(workouts, chunk_size=CHUNK_SIZE):
+    # Keep only the last copy of each id - paging can return the boundary workout twice
+    rows = list({workout['id']: workout for workout in workouts if workout.get('id') is not None}.values())
+
+    if not rows:
+        return 0
+
+    update_columns = [column.name for column in Workout.__table__.columns if column.name != 'id']
+
+    for start in range(0, len(rows), chunk_size):
+        upsert(Workout, rows[start:start + chunk_size], update_columns)
+
+    return len(rows)
+
+# Pull the split or interval rows out of a Concept2 result
+def filter_details(workout_data, key):
+    rows = []
+
+    for number, item in enumerate((workout_data.get("workout") or {}).get(key, []) or []):
+        heart_rate = item.get("heart_rate") or {}
+
+        row = {
+            "workout_id": workout_data.get("id"),
+            "number": number,
+            "user_id": workout_data.get("user_id"),
+            "type": item.get("type", None),
+            "time": item.get("time", None),
+            "distance": item.get("distance", None),
+            "calories": item.get("calories_total", None),
+            "stroke_rate": item.get("stroke_rate", None),
+            "hr_min": heart_rate.get("min", None),
+            "hr_avg": heart_rate.get("average", None),
+            "hr_max": heart_rate.get("max", None),
+            "hr_ending": heart_rate.get("ending", None)
+        }
+
+        if key == "intervals":
+            row["rest_time"] = item.get("rest_time", None)
+            row["rest_distance"] = item.get("rest_distance", None)
+
+        rows.append(row)
+
+    return rows
+
+# Replace the stored splits and intervals for a batch of raw Concept2 results
+def replace_workout_details(results, chunk_size=CHUNK_SIZE):
+    workout_ids = [result.get("id") for result in results if result.get("id") is not None]
+
+    if not workout_ids:
+        return
+
+    for model, key in ((WorkoutSplit, "splits"), (WorkoutInterval, "intervals")):
+        rows = [row for result in results for row in filter_details(result, key)]
+
+        for start in range(0, len(workout_ids), chunk_size):
+            session.execute(delete(model).where(model.workout_id.in_(workout_ids[start:start + chunk_size])))
+
+        # executemany - one round trip per chunk
+        for start in range(0, len(rows), chunk_size):
+            session.execute(insert(model), rows[start:start + chunk_size])
+
+# Store a batch of raw Concept2 results - the summary rows plus their splits and intervals
+def ingest_results(results):
+    workouts = [filter_workout(result) for result in results]
+
+    # Days these workouts were on before, in case an update has moved one
+    keys = stored_day_keys(workout["id"] for workout in workouts)
+
+    bulk_upsert_workouts(workouts)
+    replace_workout_details(results)
+
+    keys |= day_keys(workouts)
+
+    refresh_daily_totals(keys)
+    update_pbs(workouts)
+
+    # Invalidates the cached charts of everyone whose workouts changed
+    bump_versions({user_id for user_id, day in keys} | {workout["user_id"] for workout in workouts})
+
+    return workouts
+
+# Remove workouts and everything stored alongside them
+def delete_workouts(workout_ids):
+    workout_ids = list(workout_ids)
+
+    if not workout_ids:
+        return
+
+    keys = stored_day_keys(workout_ids)
+    pb_keys = event_keys(workout_ids)
+
+    for model in (WorkoutSplit, WorkoutInterval):
+        session.execute(delete(model).where(model.workout_id.in_(workout_ids)))
+
+    session.execute(delete(StrokeData).where(StrokeData.workout_id.in_(workout_ids)))
+    session.execute(delete(Workout).where(Workout.id.in_(workout_ids)))
+
+    refresh_daily_totals(keys)
+    recompute_pbs(pb_keys)
+
+    bump_versions({user_id for user_id, day in keys})
+
+# Load the stored splits and intervals for a workout, as lists of dicts in monitor order
+def load_workout_details(workout_id):
+    details = {}
+
+    for model, key in ((WorkoutSplit, "splits"), (WorkoutInterval, "intervals")):
+        rows = session.execute(
+            select(model).where(model.workout_id == workout_id).order_by(model.number)
+        ).scalars().all()
+
+        details[key] = [
+            {column.name: getattr(row, column.name) for column in model.__table__.columns}
+            for row in rows
+        ]
+
+    return details
+
+# Rebuild the Concept2 result fields the detail pages use from a stored Workout row
+def workout_to_result(workout):
+    return {
+        "id": workout.id,
+        "user_id": workout.user_id,
+        "date": workout.date.strftime("%Y-%m-%d %H:%M:%S") if workout.date else None,
+        "distance": workout.distance,
+        "type": workout.type,
+        "workout_type": workout.workout_type,
+        "time": workout.time,
+        "stroke_rate": workout.spm,
+        "heart_rate": {"average": workout.avghr},
+        "comments": workout.comments,
+        "stroke_data": bool(workout.stroke_data),
+        "rest_time": workout.rest_time
+    }
+
+# Apply a batch of queued Concept2 webhook payloads, in arrival order, returning the results stored
+def handle_webhook_events(events):
+    # Only the last event for each result matters
+    final = {}
+
+    for event in events:
+        if event.get('type') == 'result-deleted':
+            final[event.get('result_id')] = None
+        else:
+            result = event.get('result') or {}
+            final[result.get('id')] = result
+
+    results = [result for result in final.values() if result is not None]
+    deleted = [result_id for result_id, result in final.items() if result is None and result_id is not None]
+
+    ingest_results(results)
+    delete_workouts(deleted)
+
+    return results
@@ -0,0 +1,217 @@
+import json
+import sqlite3
+import threading
+import time
+
+from dcbc.project.session import session
+
+# Local journal that webhook payloads are appended to before they reach MySQL
+QUEUE_PATH = 'dcbc/data/ingest_queue.db'
+
+# Jobs handed to a handler at once
+BATCH_SIZE = 50
+
+# Attempts before a job is moved to the dead-letter table
+MAX_ATTEMPTS = 5
+
+# First retry delay in seconds - doubled on every further attempt
+RETRY_DELAY = 30
+
+# How long a claimed job is hidden from other workers before it is assumed lost
+CLAIM_TIMEOUT = 300
+
+# Seconds the background worker sleeps when the queue is empty
+POLL_INTERVAL = 2
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        priority INTEGER NOT NULL DEFAULT 0,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        available_at REAL NOT NULL,
+        claimed_until REAL NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        last_error TEXT
+    )''',
+    'CREATE INDEX IF NOT EXISTS ix_jobs_ready ON jobs (priority, available_at)',
+    '''CREATE TABLE IF NOT EXISTS dead_letter (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        attempts INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        failed_at REAL NOT NULL,
+        last_error TEXT
+    )'''
+]
+
+# A claimed unit of work
+class Job:
+    def __init__(self, id, kind, payload, attempts):
+        self.id = id
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+
+# Durable SQLite-backed job queue shared by every gunicorn worker and the cron jobs
+# Lower priority numbers are served first
+class IngestQueue:
+    def __init__(self, path=QUEUE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    # One connection per thread - sqlite3 connections cannot be shared between threads
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=FULL')  # fsync on commit - a 202 means the payload is on disk
+
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+            self._local.conn = conn
+
+        return conn
+
+    def enqueue(self, kind, payload, priority=0, delay=0):
+        now = time.time()
+
+        self._conn().execute(
+            'INSERT INTO jobs (kind, payload, priority, available_at, created_at) VALUES (?, ?, ?, ?, ?)',
+            (kind, json.dumps(payload), priority, now + delay, now)
+        )
+
+    # Claim up to `limit` ready jobs, hiding them from other workers until acked or failed
+    def claim(self, kinds=None, limit=BATCH_SIZE):
+        conn = self._conn()
+        now = time.time()
+
+        query = 'SELECT id, kind, payload, attempts FROM jobs WHERE available_at <= ? AND claimed_until < ?'
+        params = [now, now]
+
+        if kinds:
+            query += f" AND kind IN ({','.join('?' * len(kinds))})"
+            params += list(kinds)
+
+        query += ' ORDER BY priority, id LIMIT ?'
+        params.append(limit)
+
+        # BEGIN IMMEDIATE takes the write lock up front so two workers never claim the same rows
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(query, params).fetchall()
+
+            conn.executemany(
+                'UPDATE jobs SET claimed_until = ? WHERE id = ?',
+                [(now + CLAIM_TIMEOUT, row[0]) for row in rows]
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        return [Job(row[0], row[1], json.loads(row[2]), row[3]) for row in rows]
+
+    def ack(self, jobs):
+        self._conn().executemany('DELETE FROM jobs WHERE id = ?', [(job.id,) for job in jobs])
+
+    # Put a job back with exponential backoff, or dead-letter it once it has used all its attempts
+    def fail(self, job, error):
+        conn = self._conn()
+        attempts = job.attempts + 1
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if attempts >= MAX_ATTEMPTS:
+                conn.execute(
+                    '''INSERT OR REPLACE INTO dead_letter (id, kind, payload, attempts, created_at, failed_at, last_error)
+                       SELECT id, kind, payload, ?, created_at, ?, ? FROM jobs WHERE id = ?''',
+                    (attempts, time.time(), str(error), job.id)
+                )
+                conn.execute('DELETE FROM jobs WHERE id = ?', (job.id,))
+            else:
+                conn.execute(
+                    'UPDATE jobs SET attempts = ?, available_at = ?, claimed_until = 0, last_error = ? WHERE id = ?',
+                    (attempts, time.time() + RETRY_DELAY * 2 ** (attempts - 1), str(error), job.id)
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    # Number of waiting and dead-lettered jobs, for monitoring
+    def counts(self):
+        conn = self._conn()
+        return {
+            'waiting': conn.execute('SELECT COUNT(*) FROM jobs').fetchone()[0],
+            'dead': conn.execute('SELECT COUNT(*) FROM dead_letter').fetchone()[0]
+        }
+
+# Claim one batch and run it through the matching handlers
+# handlers maps a job kind to a function taking a list of payloads; it must leave the session uncommitted
+# A failing batch is retried job by job so one bad payload cannot hold up the rest
+def drain_once(queue, handlers, limit=BATCH_SIZE):
+    jobs = queue.claim(kinds=list(handlers), limit=limit)
+
+    by_kind = {}
+    for job in jobs:
+        by_kind.setdefault(job.kind, []).append(job)
+
+    for kind, kind_jobs in by_kind.items():
+        handler = handlers[kind]
+
+        try:
+            handler([job.payload for job in kind_jobs])
+            session.commit()
+            queue.ack(kind_jobs)
+            continue
+        except Exception as e:
+            session.rollback()
+            print(f"Ingest batch of {len(kind_jobs)} '{kind}' jobs failed ({e}), retrying one by one")
+
+        for job in kind_jobs:
+            try:
+                handler([job.payload])
+                session.commit()
+                queue.ack([job])
+            except Exception as e:
+                session.rollback()
+                queue.fail(job, e)
+
+    session.remove()
+
+    return len(jobs)
+
+# Drain until nothing is ready, returning the number of jobs processed
+def drain(queue, handlers, limit=BATCH_SIZE):
+    total = 0
+
+    while True:
+        processed = drain_once(queue, handlers, limit=limit)
+        total += processed
+
+        if processed == 0:
+            return total
+
+# Background thread that keeps draining the queue for the life of the process
+class QueueWorker(threading.Thread):
+    def __init__(self, queue, handlers, poll_interval=POLL_INTERVAL, limit=BATCH_SIZE, name='ingest-queue'):
+        super().__init__(daemon=True, name=name)
+        self.queue = queue
+        self.handlers = handlers
+        self.poll_interval = poll_interval
+        self.limit = limit
+
+    def run(self):
+        while True:
+            try:
+                if drain_once(self.queue, self.handlers, limit=self.limit) == 0:
+                    time.sleep(self.poll_interval)
+            except Exception as e:
+                print(f"Ingest queue worker error: {e}")
+                time.sleep(self.poll_interval)
@@ -0,0 +1,114 @@
+from datetime import datetime
+
+from sqlalchemy import Index, MetaData, Table, inspect, select, text
+
+from dcbc.models.base import Base
+from dcbc.models.schemadb import SchemaVersion
+from dcbc.models.tokendb import Token
+from dcbc.project.totals import rebuild_daily_totals
+from dcbc.project.pbs import rebuild_pbs
+
+# Add an index to an existing table unless one of that name is already there
+# create_all never touches tables that exist, so indexes added to the models after the fact need this
+def add_index(conn, table_name, index_name, columns):
+    existing = {index['name'] for index in inspect(conn).get_indexes(table_name)}
+
+    if index_name in existing:
+        return
+
+    # Reflect the live table so this works whatever the models currently say
+    table = Table(table_name, MetaData(), autoload_with=conn)
+    Index(index_name, *[table.c[column] for column in columns]).create(bind=conn)
+
+# Add a column from the models to an existing table unless it is already there
+# create_all never alters tables that exist, so columns added to the models after the fact need this
+def add_column(conn, table, column_name):
+    existing = {column['name'] for column in inspect(conn).get_columns(table.name)}
+
+    if column_name in existing:
+        return
+
+    column = table.c[column_name]
+    ddl = f'{column.name} {column.type.compile(dialect=conn.dialect)}'
+
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+
+    if not column.nullable:
+        ddl += ' NOT NULL'
+
+    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {ddl}'))
+
+def workout_indexes(conn):
+    # Per-user history by date - /plot, /data, /home and the daily refresh
+    add_index(conn, 'workouts', 'ix_workouts_user_date', ['user_id', 'date'])
+
+    # Personal bests - best time per user for each distance and type
+    add_index(conn, 'workouts', 'ix_workouts_user_piece', ['user_id', 'distance', 'workout_type', 'time'])
+
+# Sorting the /data table by time
+def workout_time_index(conn):
+    add_index(conn, 'workouts', 'ix_workouts_user_time', ['user_id', 'time'])
+
+def user_indexes(conn):
+    # Joins from workouts back to their owner
+    add_index(conn, 'users', 'ix_users_logbookid', ['logbookid'])
+
+def outing_indexes(conn):
+    add_index(conn, 'outings', 'ix_outings_date_time', ['date_time'])
+    add_index(conn, 'outings', 'ix_outings_boat_name', ['boat_name'])
+
+# Failure backoff for the token refresher, shared by every process
+def token_backoff(conn):
+    add_column(conn, Token.__table__, 'refresh_failures')
+    add_column(conn, Token.__table__, 'retry_after')
+
+# Fill the new daily_totals table from the workouts already stored
+def daily_totals(conn):
+    rebuild_daily_totals(db=conn)
+
+# Fill the new PB tables from the workouts already stored
+def personal_bests(conn):
+    rebuild_pbs(db=conn)
+
+# Applied in order, each exactly once per database - append new migrations, never renumber old ones
+# Every migration must be safe to re-run against a database that already has its changes
+MIGRATIONS = [
+    (1, 'workout indexes', workout_indexes),
+    (2, 'user logbookid index', user_indexes),
+    (3, 'outing indexes', outing_indexes),
+    (4, 'daily totals', daily_totals),
+    (5, 'personal bests', personal_bests),
+    (6, 'workout time index', workout_time_index),
+    (7, 'token refresh backoff', token_backoff),
+]
+
+def applied_versions(engine):
+    with engine.connect() as conn:
+        return set(conn.execute(select(SchemaVersion.version)).scalars())
+
+# Create any missing tables, then apply pending migrations in order, returning the versions applied
+def migrate(engine, migrations=MIGRATIONS):
+    Base.metadata.create_all(engine)
+
+    done = applied_versions(engine)
+    applied = []
+
+    for version, name, upgrade in sorted(migrations, key=lambda migration: migration[0]):
+        if version in done:
+            continue
+
+        print(f"Applying migration {version}: {name}")
+
+        # MySQL commits DDL as it goes, so the version row is only written once the change has succeeded
+        with engine.begin() as conn:
+            upgrade(conn)
+            conn.execute(SchemaVersion.__table__.insert().values(version=version, name=name, applied_at=datetime.now()))
+
+        applied.append(version)
+
+    return applied
+
+# Highest migration applied, 0 for a database that has never been migrated
+def current_version(engine):
+    return max(applied_versions(engine), default=0)
@@ -0,0 +1,209 @@
+from sqlalchemy import and_, delete, func, not_, select, tuple_
+
+from dcbc.models.workout import Workout
+from dcbc.models.usersdb import User
+from dcbc.models.pbdb import PersonalBest, PBEvent
+from dcbc.project.session import session, upsert
+
+# Standard pieces tracked for PBs
+# Distance pieces are ranked on time (lower is better), timed pieces on distance (higher is better)
+PIECES = {
+    '500m': {'name': '500m', 'workout_type': 'FixedDistanceSplits', 'distance': 500},
+    '1k': {'name': '1K', 'workout_type': 'FixedDistanceSplits', 'distance': 1000},
+    '2k': {'name': '2K', 'workout_type': 'FixedDistanceSplits', 'distance': 2000},
+    '5k': {'name': '5K', 'workout_type': 'FixedDistanceSplits', 'distance': 5000},
+    '6k': {'name': '6K', 'workout_type': 'FixedDistanceSplits', 'distance': 6000},
+    '10k': {'name': '10K', 'workout_type': 'FixedDistanceSplits', 'distance': 10000},
+    '30r20': {'name': '30r20', 'workout_type': 'FixedTimeSplits', 'time': 18000, 'max_spm': 21},
+    '30min': {'name': '30 minutes', 'workout_type': 'FixedTimeSplits', 'time': 18000},
+    '60min': {'name': '60 minutes', 'workout_type': 'FixedTimeSplits', 'time': 36000},
+}
+
+def ranked_on_time(piece):
+    return 'distance' in PIECES[piece]
+
+# Does a workout dict (as stored by ingest) count as an attempt at a piece?
+def is_attempt(piece, workout):
+    spec = PIECES[piece]
+
+    if workout.get('workout_type') != spec['workout_type']:
+        return False
+
+    if 'distance' in spec:
+        return workout.get('distance') == spec['distance'] and workout.get('time') is not None
+
+    if workout.get('time') != spec['time'] or workout.get('distance') is None:
+        return False
+
+    return 'max_spm' not in spec or (workout.get('spm') is not None and workout['spm'] <= spec['max_spm'])
+
+# SQL version of is_attempt
+def attempt_filter(piece):
+    spec = PIECES[piece]
+
+    conditions = [Workout.workout_type == spec['workout_type']]
+
+    if 'distance' in spec:
+        conditions += [Workout.distance == spec['distance'], Workout.time.is_not(None)]
+    else:
+        conditions += [Workout.time == spec['time'], Workout.distance.is_not(None)]
+
+    if 'max_spm' in spec:
+        conditions.append(Workout.spm <= spec['max_spm'])
+
+    return and_(*conditions)
+
+def beats(piece, workout, best):
+    if ranked_on_time(piece):
+        return workout['time'] < best['time']
+
+    return workout['distance'] > best['distance']
+
+# Walk one user's attempts in the order they were rowed, keeping each one that beat everything before it
+def progression(piece, attempts):
+    events = []
+
+    for attempt in attempts:
+        if not events or beats(piece, attempt, events[-1]):
+            events.append(attempt)
+
+    return events
+
+# Recompute bests and progressions for the given (user_id, piece) pairs from the stored workouts
+def recompute_pbs(keys, db=session):
+    for user_id, piece in sorted(keys):
+        attempts = db.execute(
+            select(Workout.id.label('workout_id'), Workout.date, Workout.time, Workout.distance)
+            .where(Workout.user_id == user_id, Workout.date.is_not(None), attempt_filter(piece))
+            .order_by(Workout.date, Workout.id)
+        ).mappings().all()
+
+        write_pbs(user_id, piece, progression(piece, attempts), db=db)
+
+# Store one user's progression for a piece, and its last event as their best
+# Ingest threads and the cron job can write the same pair at once, so rows are upserted and only events that
+# dropped out of the progression are deleted, by primary key - a delete-then-insert could deadlock or collide
+def write_pbs(user_id, piece, events, db=session):
+    rows = [
+        {'workout_id': event['workout_id'], 'piece': piece, 'user_id': user_id,
+         'date': event['date'], 'time': event['time'], 'distance': event['distance']}
+        for event in events
+    ]
+
+    upsert(PBEvent, rows, ['user_id', 'date', 'time', 'distance'], db=db)
+
+    stored = db.execute(
+        select(PBEvent.workout_id).where(PBEvent.user_id == user_id, PBEvent.piece == piece)
+    ).scalars().all()
+
+    stale = sorted(set(stored) - {row['workout_id'] for row in rows})
+
+    if stale:
+        db.execute(delete(PBEvent).where(PBEvent.piece == piece, PBEvent.workout_id.in_(stale)))
+
+    if rows:
+        upsert(PersonalBest, [rows[-1]], ['workout_id', 'date', 'time', 'distance'], db=db)
+    else:
+        db.execute(delete(PersonalBest).where(PersonalBest.user_id == user_id, PersonalBest.piece == piece))
+
+# (user_id, piece) pairs with a PB event on any of these workouts - recomputed if they change or go
+def event_keys(workout_ids, db=session):
+    workout_ids = list(workout_ids)
+
+    if not workout_ids:
+        return set()
+
+    return set(db.execute(
+        select(PBEvent.user_id, PBEvent.piece).where(PBEvent.workout_id.in_(workout_ids))
+    ).tuples().all())
+
+# Bring the PB index up to date after some workouts have been stored
+# Only user/piece pairs the new results can change are recomputed: a result later than the stored best
+# that does not beat it is not a PB and cannot affect the progression, which is the common case
+def update_pbs(workouts, db=session):
+    keys = event_keys((workout['id'] for workout in workouts), db=db)
+
+    attempts = [
+        (workout, piece)
+        for workout in workouts if workout.get('user_id') is not None and workout.get('date') is not None
+        for piece in PIECES if is_attempt(piece, workout)
+    ]
+
+    if attempts:
+        pairs = {(workout['user_id'], piece) for workout, piece in attempts}
+
+        bests = {
+            (row['user_id'], row['piece']): row
+            for row in db.execute(
+                select(PersonalBest.user_id, PersonalBest.piece, PersonalBest.date,
+                       PersonalBest.time, PersonalBest.distance)
+                .where(tuple_(PersonalBest.user_id, PersonalBest.piece).in_(list(pairs)))
+            ).mappings().all()
+        }
+
+        for workout, piece in attempts:
+            best = bests.get((workout['user_id'], piece))
+
+            if best is None or workout['date'] < best['date'] or beats(piece, workout, best):
+                keys.add((workout['user_id'], piece))
+
+    recompute_pbs(keys, db=db)
+
+# Throw away and recompute the whole PB index
+def rebuild_pbs(db=session):
+    db.execute(delete(PBEvent))
+    db.execute(delete(PersonalBest))
+
+    for piece in PIECES:
+        attempts = db.execute(
+            select(Workout.user_id, Workout.id.label('workout_id'), Workout.date, Workout.time, Workout.distance)
+            .where(Workout.user_id.is_not(None), Workout.date.is_not(None), attempt_filter(piece))
+            .order_by(Workout.user_id, Workout.date, Workout.id)
+        ).mappings().all()
+
+        by_user = {}
+        for attempt in attempts:
+            by_user.setdefault(attempt['user_id'], []).append(attempt)
+
+        for user_id, user_attempts in by_user.items():
+            write_pbs(user_id, piece, progression(piece, user_attempts), db=db)
+
+# A user's current bests, keyed by piece
+def user_bests(user_id):
+    rows = session.execute(select(PersonalBest).where(PersonalBest.user_id == user_id)).scalars().all()
+
+    return {row.piece: row for row in rows}
+
+# A user's PB progression for one piece, oldest first
+def user_progression(user_id, piece):
+    return session.execute(
+        select(PBEvent).where(PBEvent.user_id == user_id, PBEvent.piece == piece).order_by(PBEvent.date)
+    ).scalars().all()
+
+# Club-wide PB board: every active member's best for each piece, best first, from one query
+def club_bests(pieces=PIECES):
+    rows = session.execute(
+        select(PersonalBest, User.crsid, User.preferred_name, User.last_name)
+        .join(User, User.logbookid == PersonalBest.user_id)
+        .where(PersonalBest.piece.in_(list(pieces)), not_(func.find_in_set('Inactive', User.tags)))
+    ).all()
+
+    board = {piece: [] for piece in pieces}
+
+    for best, crsid, preferred_name, last_name in rows:
+        board[best.piece].append({
+            'crsid': crsid,
+            'name': f'{preferred_name} {last_name}',
+            'workout_id': best.workout_id,
+            'date': best.date,
+            'time': best.time,
+            'distance': best.distance
+        })
+
+    for piece, entries in board.items():
+        if ranked_on_time(piece):
+            entries.sort(key=lambda entry: entry['time'])
+        else:
+            entries.sort(key=lambda entry: -entry['distance'])
+
+    return board
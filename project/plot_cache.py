@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+import time
+
+# Chart data, shared by every gunicorn worker
+PLOT_CACHE_DIR = 'dcbc/data/plot_cache'
+
+# Entries are keyed on the data version (which covers members' names and colours for the club charts),
+# so this only bounds how long dead entries linger
+PLOT_CACHE_TTL = 6 * 60 * 60
+
+# File cache of the JSON chart payloads served under /api/v1 (see project/charts.py), totals included
+# Keys combine the route, the data version and the request's parameters, so new workouts simply miss the cache
+class PlotCache:
+    def __init__(self, path=PLOT_CACHE_DIR, ttl=PLOT_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+
+    # Stable digest of an entry's version and parameters - also serves as its ETag
+    def key(self, route, version, params):
+        return hashlib.sha256(json.dumps([route, version, [str(param) for param in params]]).encode()).hexdigest()
+
+    def _file(self, route, version, params):
+        return os.path.join(self.path, route, f'{self.key(route, version, params)}.json')
+
+    def get(self, route, version, params):
+        path = self._file(route, version, params)
+
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+
+            with open(path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    # Write via a temporary file and rename, so other workers never read half an entry
+    def put(self, route, version, params, value):
+        path = self._file(route, version, params)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        temp_path = f'{path}.{os.getpid()}.tmp'
+
+        with open(temp_path, 'w') as file:
+            json.dump(value, file)
+
+        os.replace(temp_path, path)
+
+    # Cached value for these parameters, calling build() to render and store it on a miss
+    def cached(self, route, version, params, build):
+        value = self.get(route, version, params)
+
+        if value is None:
+            value = build()
+            self.put(route, version, params, value)
+
+        return value
+
+    # Delete expired entries, returning how many went
+    def prune(self):
+        removed = 0
+        cutoff = time.time() - self.ttl
+
+        for root, dirs, files in os.walk(self.path):
+            for name in files:
+                path = os.path.join(root, name)
+
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    continue
+
+        return removed
+
+plot_cache = PlotCache()
@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+
+from dcbc.models.usersdb import User
+from dcbc.project.session import session
+from dcbc.project.ingest import ingest_results
+from dcbc.project.strokes import has_strokes, store_strokes
+
+# Queue priority for prefetches - served after webhook ingestion (priority 0)
+PREFETCH_PRIORITY = 10
+
+# Concurrent Concept2 requests per process while prefetching
+PREFETCH_WORKERS = 2
+
+# Prefetch jobs claimed at once
+PREFETCH_BATCH = 10
+
+# Queue a background fetch of result detail and strokes for freshly ingested results
+def schedule_prefetch(queue, results):
+    for result in results:
+        if result.get('stroke_data') and result.get('id') is not None:
+            queue.enqueue('prefetch', {'workout_id': result['id'], 'user_id': result.get('user_id')}, priority=PREFETCH_PRIORITY)
+
+# Fetch result detail and strokes for one workout - network only, no database access
+def fetch_workout(concept2, crsid, logbookid, workout_id, need_strokes):
+    dataresponse = concept2.get(crsid, f'users/{logbookid}/results/{workout_id}')
+
+    if 'data' not in dataresponse:
+        raise RuntimeError(f"Result {workout_id} fetch failed: {dataresponse.get('status_code')}")
+
+    strokes = None
+    if need_strokes:
+        strokeresponse = concept2.get(crsid, f'users/{logbookid}/results/{workout_id}/strokes')
+
+        if 'data' not in strokeresponse:
+            raise RuntimeError(f"Strokes {workout_id} fetch failed: {strokeresponse.get('status_code')}")
+
+        strokes = strokeresponse['data']
+
+    return dataresponse['data'], strokes
+
+# Queue handler: pull down everything /workout needs so the first view is a local read
+# Raises if any fetch fails so the queue retries the failures with backoff
+def prefetch_workouts(concept2, payloads):
+    logbookids = {payload.get('user_id') for payload in payloads}
+
+    crsids = dict(session.execute(
+        select(User.logbookid, User.crsid).where(User.logbookid.in_(logbookids))
+    ).all())
+
+    jobs = []
+    for payload in payloads:
+        crsid = crsids.get(payload.get('user_id'))
+
+        # Not a club member (any more) - nothing to prefetch
+        if crsid is None:
+            continue
+
+        jobs.append((crsid, payload['user_id'], payload['workout_id'], not has_strokes(payload['workout_id'])))
+
+    with ThreadPoolExecutor(max_workers=PREFETCH_WORKERS) as pool:
+        fetched = list(pool.map(lambda job: fetch_workout(concept2, *job), jobs))
+
+    ingest_results([result for result, strokes in fetched])
+
+    for result, strokes in fetched:
+        if strokes is not None:
+            store_strokes(result['id'], strokes)
@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from dcbc.project.tokens import EXPIRY_SKEW
+
+# How long a Concept2 profile is reused from memory before it is fetched again
+PROFILE_TTL = 15 * 60
+
+# Encrypted copy of the user's Concept2 profile
+def profile_path(crsid):
+    return f'dcbc/data/{crsid}/user_info.txt'
+
+# Concept2 profiles (users/me), cached in memory and mirrored to user_info.txt
+# The file is only rewritten when the profile actually changes
+class ProfileCache:
+    def __init__(self, concept2, datacipher, ttl=PROFILE_TTL):
+        self.concept2 = concept2
+        self.datacipher = datacipher
+        self.ttl = ttl
+
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, crsid):
+        with self._lock:
+            entry = self._cache.get(crsid)
+
+        if entry is not None and entry[1] > time.time():
+            return entry[0]
+
+        return None
+
+    def _remember(self, crsid, profile):
+        with self._lock:
+            self._cache[crsid] = (profile, time.time() + self.ttl)
+
+    def forget(self, crsid):
+        with self._lock:
+            self._cache.pop(crsid, None)
+
+    # Decrypted user_info.txt, None if missing or unreadable
+    def stored(self, crsid):
+        path = profile_path(crsid)
+
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, 'rb') as file:
+                return json.loads(self.datacipher.decrypt(file.read()).decode())
+        except Exception:
+            return None
+
+    # Write user_info.txt, skipping the write when nothing has changed
+    def _save(self, crsid, profile):
+        if self.stored(crsid) == profile:
+            return
+
+        os.makedirs(os.path.dirname(profile_path(crsid)), exist_ok=True)
+
+        with open(profile_path(crsid), 'wb') as file:
+            file.write(self.datacipher.encrypt(json.dumps(profile).encode()))
+
+    # True when the stored token is known not to have expired, so it does not need checking against Concept2
+    def token_valid(self, crsid):
+        expires_at = self.concept2.tokens.expires_at(crsid)
+
+        return expires_at is not None and expires_at - timedelta(seconds=EXPIRY_SKEW) > datetime.now()
+
+    # The user's Concept2 profile, from memory if recent, otherwise from the API; None if Concept2 refuses
+    def get(self, crsid, fresh=False):
+        profile = None if fresh else self._cached(crsid)
+
+        if profile is not None:
+            return profile
+
+        # The client refreshes the token itself if Concept2 rejects it
+        dataresponse = self.concept2.get(crsid, 'users/me')
+
+        if 'data' not in dataresponse:
+            return None
+
+        profile = dataresponse['data']
+
+        self._save(crsid, profile)
+        self._remember(crsid, profile)
+
+        return profile
+
+    # Make sure the user has a working token and a stored profile, without calling Concept2 when both are known good
+    def check(self, crsid):
+        if self.token_valid(crsid) and (self._cached(crsid) is not None or os.path.exists(profile_path(crsid))):
+            return True
+
+        return self.get(crsid) is not None
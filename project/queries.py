@@ -0,0 +1,172 @@
+from sqlalchemy import select, func
+
+from dcbc.models.workout import Workout
+from dcbc.project.session import session, engine
+from dcbc.project.utils import format_seconds, format_deciseconds, format_splits
+
+# Whole-number columns, stored as int32 when none are missing (pandas would otherwise use int64, or float64 with gaps)
+INT_COLUMNS = ('id', 'user_id', 'distance', 'time', 'spm', 'avghr', 'rest_time')
+
+# Low-cardinality text columns, stored as categoricals
+CATEGORY_COLUMNS = ('type', 'workout_type')
+
+def to_datetime(value):
+    import pandas as pd
+
+    return pd.Timestamp(value).to_pydatetime()
+
+# One user's workouts as a DataFrame, oldest first
+# Only the named columns are selected, and the date range (inclusive) and type filters run in SQL,
+# so the cost of a page follows the season being viewed rather than the user's whole logbook
+def workouts_frame(user_id, columns, from_date=None, to_date=None, types=None, workout_types=None, categories=True):
+    import pandas as pd
+
+    query = select(*[getattr(Workout, column).label(column) for column in columns]).where(Workout.user_id == user_id)
+
+    if from_date is not None:
+        query = query.where(Workout.date >= to_datetime(from_date))
+
+    if to_date is not None:
+        query = query.where(Workout.date <= to_datetime(to_date))
+
+    if types:
+        query = query.where(Workout.type.in_(types))
+
+    if workout_types:
+        query = query.where(Workout.workout_type.in_(workout_types))
+
+    query = query.order_by(Workout.date)
+
+    df = pd.read_sql(query, engine)
+
+    return compact_workouts(df, categories=categories)
+
+# Shrink a workouts DataFrame to compact dtypes in place, returning it
+def compact_workouts(df, categories=True):
+    import pandas as pd
+
+    if 'date' in df:
+        df['date'] = pd.to_datetime(df['date'])
+
+    for column in INT_COLUMNS:
+        if column in df:
+            values = pd.to_numeric(df[column], errors='coerce')
+            df[column] = values.astype('int32') if not values.isna().any() else values
+
+    if categories:
+        for column in CATEGORY_COLUMNS:
+            if column in df:
+                df[column] = df[column].astype('category')
+
+    return df
+
+# Columns the workout table can be sorted on - each is served by one of the (user_id, ...) indexes,
+# apart from split, which is worked out per row but only over the one user's filtered workouts
+SORT_COLUMNS = {
+    'date': Workout.date,
+    'distance': Workout.distance,
+    'time': Workout.time,
+    'split': Workout.time * 500.0 / func.nullif(Workout.distance, 0)
+}
+
+# Rows per page of the workout table, and the most a caller may ask for
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Columns shown in the workout table, in order
+TABLE_COLUMNS = ('id', 'date', 'distance', 'time', 'split', 'spm', 'type', 'workout_type', 'avghr', 'comments')
+
+# One page of a user's workouts for the /data table, with totals over every workout that matches the filters
+# Sorting, filtering, paging and the totals all run in SQL, so the work per page is the same however long the logbook
+def workout_page(user_id, from_date=None, to_date=None, types=None, sort='date', descending=False, page=1, per_page=PAGE_SIZE):
+    filters = [Workout.user_id == user_id]
+
+    if from_date is not None:
+        filters.append(Workout.date >= to_datetime(from_date))
+
+    if to_date is not None:
+        filters.append(Workout.date <= to_datetime(to_date))
+
+    if types:
+        filters.append(Workout.type.in_(types))
+
+    count, distance, time = session.execute(
+        select(func.count(), func.sum(Workout.distance), func.sum(Workout.time)).where(*filters)
+    ).one()
+
+    per_page = min(max(int(per_page), 1), MAX_PAGE_SIZE)
+    pages = max(1, -(-count // per_page))
+    page = min(max(int(page), 1), pages)
+
+    sort_column = SORT_COLUMNS.get(sort, Workout.date)
+    order = sort_column.desc() if descending else sort_column.asc()
+
+    # Workout id breaks ties, so rows never move between pages
+    workouts = session.execute(
+        select(*[getattr(Workout, column) for column in TABLE_COLUMNS if column != 'split'])
+        .where(*filters)
+        .order_by(order, Workout.id)
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+    ).mappings().all()
+
+    # Formatted a page at a time, exactly as the other pages show times and splits
+    times = [workout['time'] if workout['time'] is not None else float('nan') for workout in workouts]
+    distances = [workout['distance'] if workout['distance'] is not None else float('nan') for workout in workouts]
+
+    rows = []
+
+    for workout, split, workout_time in zip(workouts, format_splits(times, distances), format_deciseconds(times)):
+        row = {column: workout.get(column) for column in TABLE_COLUMNS}
+
+        row['date'] = str(workout['date']) if workout['date'] is not None else None
+        row['split'] = split
+        row['time'] = workout_time
+
+        # Concept2 reports missing values as 'unknown'
+        rows.append({column: (None if value == 'unknown' else value) for column, value in row.items()})
+
+    return {
+        'columns': list(TABLE_COLUMNS),
+        'rows': rows,
+        'page': page,
+        'pages': pages,
+        'per_page': per_page,
+        'count': count,
+        'totaldist': int(distance or 0),
+        'totaltime': format_seconds((time or 0) / 10)
+    }
+
+# Erg types a user has logged, for the table's type filter
+def workout_types(user_id):
+    return session.execute(
+        select(Workout.type).where(Workout.user_id == user_id, Workout.type.is_not(None)).distinct().order_by(Workout.type)
+    ).scalars().all()
+
+# Dates the workout table shows when none are given - shared by /data and /api/v1/workouts
+TABLE_FROM_DATE = '2024-01-01'
+TABLE_TO_DATE = '2024-12-31'
+
+# workout_page arguments from a request's query string: from_date, to_date, type, sort, order, page, per_page
+# Anything missing or malformed falls back to the defaults rather than failing the page
+def table_query(args):
+    def number(name, default):
+        try:
+            return int(args.get(name, default))
+        except ValueError:
+            return default
+
+    if 'from_date' in args and 'to_date' in args:
+        from_date, to_date = args.get('from_date'), args.get('to_date')
+    else:
+        from_date, to_date = TABLE_FROM_DATE, TABLE_TO_DATE
+
+    return {
+        'from_date': from_date,
+        'to_date': to_date,
+        'types': [erg_type for erg_type in args.getlist('type') if erg_type],
+        'sort': args.get('sort') if args.get('sort') in SORT_COLUMNS else 'date',
+        'descending': args.get('order') == 'desc',
+        'page': number('page', 1),
+        'per_page': number('per_page', PAGE_SIZE)
+    }
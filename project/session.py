@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.pool import QueuePool
 import json
@@ -26,3 +28,29 @@ engine = create_engine(
 # Create session factory and scoped session
 Session = sessionmaker(bind=engine)
 session = scoped_session(Session)
+
+# Insert rows into a model's table, overwriting update_columns on rows whose primary key already exists
+# A single multi-row statement on MySQL and SQLite (used in development); anything else merges row by row
+# db may be a session or, as in migrations, a connection
+def upsert(model, rows, update_columns, db=session):
+    if not rows:
+        return
+
+    dialect = db.dialect.name if hasattr(db, 'dialect') else db.get_bind().dialect.name
+
+    if dialect in ('mysql', 'mariadb'):
+        stmt = mysql_insert(model).values(rows)
+        stmt = stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in update_columns})
+
+    elif dialect == 'sqlite':
+        stmt = sqlite_insert(model).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[column.name for column in model.__table__.primary_key],
+            set_={column: stmt.excluded[column] for column in update_columns})
+
+    else:
+        for row in rows:
+            db.merge(model(**row))
+        return
+
+    db.execute(stmt)
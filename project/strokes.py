@@ -0,0 +1,51 @@
+from sqlalchemy import select
+
+from dcbc.models.strokedb import StrokeData
+from dcbc.project.session import session
+
+# Fields in each Concept2 stroke: time (ds), distance (dm), pace (ds/500m), rate, heart rate
+STROKE_FIELDS = ('t', 'd', 'p', 'spm', 'hr')
+
+# Little-endian int32 - numpy and pandas are imported on first use so importing this module stays cheap
+STROKE_DTYPE = '<i4'
+
+# Pack a list of Concept2 stroke dicts into a StrokeData row
+def pack_strokes(workout_id, strokes):
+    import numpy as np
+
+    columns = {
+        field: np.fromiter((stroke.get(field) or 0 for stroke in strokes), dtype=STROKE_DTYPE, count=len(strokes)).tobytes()
+        for field in STROKE_FIELDS
+    }
+
+    return StrokeData(workout_id=workout_id, count=len(strokes), **columns)
+
+# Unpack a stored row into a DataFrame with one int32 column per field
+def unpack_strokes(row):
+    import numpy as np
+    import pandas as pd
+
+    return pd.DataFrame({
+        field: np.frombuffer(getattr(row, field), dtype=STROKE_DTYPE)
+        for field in STROKE_FIELDS
+    })
+
+# Stroke data never changes after upload, so once stored it can be served from here forever
+def load_strokes(workout_id):
+    row = session.execute(select(StrokeData).where(StrokeData.workout_id == workout_id)).scalars().first()
+
+    if row is None:
+        return None
+
+    return unpack_strokes(row)
+
+# Number of strokes stored for a workout, None if they have not been fetched yet
+def stroke_count(workout_id):
+    return session.execute(select(StrokeData.count).where(StrokeData.workout_id == workout_id)).scalar()
+
+def has_strokes(workout_id):
+    return session.execute(select(StrokeData.workout_id).where(StrokeData.workout_id == workout_id)).first() is not None
+
+# Store the strokes returned by the Concept2 /strokes endpoint
+def store_strokes(workout_id, strokes):
+    session.merge(pack_strokes(workout_id, strokes))
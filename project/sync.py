@@ -0,0 +1,38 @@
+from datetime import datetime
+
+from sqlalchemy import select
+
+from dcbc.models.syncdb import SyncState
+from dcbc.project.session import session
+
+# Earliest date asked of the logbook when doing a full resync
+FULL_SYNC_FROM = '2000-01-01'
+
+# Look up the stored high-water mark for a user, None if never synced
+def get_sync_state(crsid):
+    return session.execute(select(SyncState).where(SyncState.crsid == crsid)).scalars().first()
+
+# Date to start fetching from - the day of the newest synced workout, so anything logged later that day is caught
+def sync_from_date(crsid, full=False):
+    state = None if full else get_sync_state(crsid)
+
+    if state is None or state.last_date is None:
+        return FULL_SYNC_FROM
+
+    return state.last_date.strftime('%Y-%m-%d')
+
+# Advance the high-water mark to the newest of the given workout rows (never moves it backwards)
+def update_sync_state(crsid, workouts):
+    state = get_sync_state(crsid) or SyncState(crsid=crsid)
+
+    for workout in workouts:
+        if workout.get('date') is None:
+            continue
+
+        if state.last_date is None or (workout['date'], workout['id']) > (state.last_date, state.last_id or 0):
+            state.last_date = workout['date']
+            state.last_id = workout['id']
+
+    state.synced_at = datetime.now()
+
+    session.merge(state)
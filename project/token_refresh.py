@@ -0,0 +1,62 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Renew tokens this long before they lapse
+REFRESH_AHEAD = 15 * 60
+
+# Seconds between checks for expiring tokens
+CHECK_INTERVAL = 60
+
+# Tokens renewed per check, and how many refresh POSTs run at once
+REFRESH_BATCH = 50
+REFRESH_WORKERS = 4
+
+# After a failed refresh, leave the user alone for this long, doubling for each further failure up to the cap
+# The retry time is stored with the token, so every worker's refresher (and the cron job) honours it
+FAILURE_BACKOFF = 6 * 60 * 60
+MAX_FAILURE_BACKOFF = 7 * 24 * 60 * 60
+
+# Renew every token expiring soon, in parallel, returning (renewed, failed) counts
+def refresh_expiring(concept2, ahead=REFRESH_AHEAD, limit=REFRESH_BATCH, workers=REFRESH_WORKERS):
+    crsids = concept2.tokens.expiring(ahead, limit=limit)
+
+    if not crsids:
+        return 0, 0
+
+    def renew(crsid):
+        # Pass the current token and the window, so a refresh someone else has just done is not repeated
+        current = concept2.load_token(crsid, fresh=True)
+
+        if current is None:
+            return crsid, None
+
+        return crsid, concept2.refresh_token(crsid, stale_token=current, ahead=ahead)
+
+    renewed = failed = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for crsid, new_token in pool.map(renew, crsids):
+            if new_token is None:
+                concept2.tokens.refresh_failed(crsid, FAILURE_BACKOFF, MAX_FAILURE_BACKOFF)
+                failed += 1
+            else:
+                renewed += 1
+
+    return renewed, failed
+
+# Background thread that keeps tokens renewed ahead of expiry, so requests rarely refresh inline
+class TokenRefresher(threading.Thread):
+    def __init__(self, concept2, interval=CHECK_INTERVAL):
+        super().__init__(daemon=True, name='token-refresher')
+        self.concept2 = concept2
+        self.interval = interval
+
+    def run(self):
+        while True:
+            try:
+                refresh_expiring(self.concept2)
+            except Exception as e:
+                print(f"Token refresher error: {e}")
+
+            time.sleep(self.interval)
@@ -0,0 +1,220 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+
+from dcbc.models.tokendb import Token
+from dcbc.project.session import Session
+
+# Longest a decrypted token is trusted from memory - bounds staleness if another process refreshes it
+MAX_CACHE_TTL = 300
+
+# Treat tokens as expired this many seconds early to allow for clock skew and slow requests
+EXPIRY_SKEW = 60
+
+# Where tokens lived before they moved into the database
+def legacy_token_path(crsid):
+    return f'dcbc/data/{crsid}/token.txt'
+
+# When a token just issued by Concept2 runs out, from its expires_in
+def token_expiry(token_data):
+    expires_in = token_data.get('expires_in')
+    return datetime.now() + timedelta(seconds=int(expires_in)) if expires_in else None
+
+# Encrypted token table with a small in-process cache of decrypted tokens
+# Each read and write uses its own short session so it never joins, or commits, a request's transaction
+class TokenStore:
+    def __init__(self, datacipher, cache_ttl=MAX_CACHE_TTL):
+        self.datacipher = datacipher
+        self.cache_ttl = cache_ttl
+
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _cache_put(self, crsid, token_data, expires_at):
+        cached_until = time.time() + self.cache_ttl
+
+        if expires_at is not None:
+            cached_until = min(cached_until, expires_at.timestamp() - EXPIRY_SKEW)
+
+        with self._lock:
+            self._cache[crsid] = (token_data, expires_at, cached_until)
+
+    def _cache_get(self, crsid):
+        with self._lock:
+            entry = self._cache.get(crsid)
+
+        if entry is not None and entry[2] > time.time():
+            return entry
+
+        return None
+
+    def _load(self, crsid):
+        with Session() as db:
+            row = db.execute(select(Token).where(Token.crsid == crsid)).scalars().first()
+
+        if row is None:
+            return self._import_legacy(crsid)
+
+        return json.loads(self.datacipher.decrypt(row.data).decode()), row.expires_at
+
+    # First use after the move to the database - copy the old token.txt across
+    def _import_legacy(self, crsid):
+        path = legacy_token_path(crsid)
+
+        if not os.path.exists(path):
+            return None
+
+        with open(path, 'rb') as file:
+            token_data = json.loads(self.datacipher.decrypt(file.read()).decode())
+
+        # Expiry unknown for old files - leave it unset so the token is checked on use
+        try:
+            self._write(crsid, token_data, None)
+        except IntegrityError:
+            # Another worker imported the same file first - its session rolled back, so use the row that won
+            return self._load(crsid)
+
+        return token_data, None
+
+    # Decrypted token for a user, None if they have not authorised; fresh=True skips the cache
+    def get(self, crsid, fresh=False):
+        entry = None if fresh else self._cache_get(crsid)
+
+        if entry is None:
+            loaded = self._load(crsid)
+
+            if loaded is None:
+                return None
+
+            self._cache_put(crsid, *loaded)
+            return loaded[0]
+
+        return entry[0]
+
+    # When the stored token runs out, None if unknown
+    def expires_at(self, crsid):
+        entry = self._cache_get(crsid)
+
+        if entry is None:
+            loaded = self._load(crsid)
+            return loaded[1] if loaded else None
+
+        return entry[1]
+
+    # Users whose token runs out within `seconds`, soonest first - tokens of unknown expiry are included
+    # Tokens still backing off from a failed refresh are left out before the limit, so they never crowd out live ones
+    def expiring(self, seconds, limit=None):
+        now = datetime.now()
+        cutoff = now + timedelta(seconds=seconds)
+
+        query = (
+            select(Token.crsid)
+            .where((Token.expires_at <= cutoff) | (Token.expires_at.is_(None)))
+            .where((Token.retry_after.is_(None)) | (Token.retry_after <= now))
+            .order_by(Token.expires_at)
+        )
+
+        if limit is not None:
+            query = query.limit(limit)
+
+        with Session() as db:
+            return db.execute(query).scalars().all()
+
+    # Note a failed background refresh; the token is skipped by expiring() for `backoff` seconds,
+    # doubling with each failure in a row up to `max_backoff`
+    def refresh_failed(self, crsid, backoff, max_backoff):
+        with Session() as db:
+            row = db.execute(select(Token).where(Token.crsid == crsid).with_for_update()).scalars().first()
+
+            if row is None:
+                return
+
+            row.refresh_failures = (row.refresh_failures or 0) + 1
+            delay = min(backoff * 2 ** (row.refresh_failures - 1), max_backoff)
+            row.retry_after = datetime.now() + timedelta(seconds=delay)
+            db.commit()
+
+    def has(self, crsid):
+        return self.get(crsid) is not None
+
+    # Store a token just issued by Concept2, working out its expiry from expires_in
+    def put(self, crsid, token_data):
+        self._write(crsid, token_data, token_expiry(token_data))
+
+    # Replace a user's token with renew(current_token) while holding a row lock on it
+    # The lock is shared by every process, so concurrent refreshes of one user run one at a time;
+    # a caller that waited and finds the token no longer matches stale_token gets the winner's token instead
+    # With `ahead` (seconds), a locked token that no longer runs out within that window is returned without renewing -
+    # proactive callers can read the token just before another process commits its refresh
+    def refresh(self, crsid, renew, stale_token=None, ahead=None):
+        # Make sure a legacy token has been copied into the table so there is a row to lock
+        if self._load(crsid) is None:
+            return None
+
+        with Session() as db:
+            row = db.execute(select(Token).where(Token.crsid == crsid).with_for_update()).scalars().first()
+
+            if row is None:
+                return None
+
+            token_data = json.loads(self.datacipher.decrypt(row.data).decode())
+
+            if stale_token is not None and token_data.get('access_token') != stale_token.get('access_token'):
+                db.rollback()
+                self._cache_put(crsid, token_data, row.expires_at)
+                return token_data
+
+            if ahead is not None and row.expires_at is not None and row.expires_at > datetime.now() + timedelta(seconds=ahead):
+                db.rollback()
+                self._cache_put(crsid, token_data, row.expires_at)
+                return token_data
+
+            new_token = renew(token_data)
+
+            if new_token is None:
+                db.rollback()
+                return None
+
+            expires_at = token_expiry(new_token)
+
+            row.data = self.datacipher.encrypt(json.dumps(new_token).encode())
+            row.expires_at = expires_at
+            row.updated_at = datetime.now()
+            row.refresh_failures = 0
+            row.retry_after = None
+            db.commit()
+
+        self._cache_put(crsid, new_token, expires_at)
+
+        return new_token
+
+    # Encrypt and write a token through to the database, then the cache
+    def _write(self, crsid, token_data, expires_at):
+        row = Token(
+            crsid=crsid,
+            data=self.datacipher.encrypt(json.dumps(token_data).encode()),
+            expires_at=expires_at,
+            updated_at=datetime.now(),
+            refresh_failures=0,
+            retry_after=None
+        )
+
+        # Single-row upsert in its own transaction
+        with Session() as db:
+            db.merge(row)
+            db.commit()
+
+        self._cache_put(crsid, token_data, expires_at)
+
+    def delete(self, crsid):
+        with Session() as db:
+            db.execute(delete(Token).where(Token.crsid == crsid))
+            db.commit()
+
+        with self._lock:
+            self._cache.pop(crsid, None)
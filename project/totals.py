@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import Date, and_, delete, func, insert, or_, select, tuple_
+
+from dcbc.models.workout import Workout
+from dcbc.models.totalsdb import DailyTotal
+from dcbc.project.session import session, upsert
+
+# (user, day) pairs recomputed per statement
+CHUNK_SIZE = 200
+
+# Workouts grouped into daily_totals rows - type is part of the key, so a missing one is stored as ''
+def totals_query():
+    day = func.date(Workout.date, type_=Date)
+    erg_type = func.coalesce(Workout.type, '')
+
+    return (
+        select(
+            Workout.user_id, day, erg_type,
+            func.coalesce(func.sum(Workout.distance), 0),
+            func.coalesce(func.sum(Workout.time), 0),
+            func.count()
+        )
+        .where(Workout.user_id.is_not(None), Workout.date.is_not(None))
+        .group_by(Workout.user_id, day, erg_type)
+    )
+
+TOTAL_COLUMNS = ['user_id', 'date', 'type', 'distance', 'time', 'count']
+
+# (user_id, day) pairs touched by some workout dicts or rows
+def day_keys(workouts):
+    keys = set()
+
+    for workout in workouts:
+        user_id, date = workout['user_id'], workout['date']
+
+        if user_id is not None and date is not None:
+            keys.add((user_id, date.date() if isinstance(date, datetime) else date))
+
+    return keys
+
+# (user_id, day) pairs of workouts already stored - read before an update or delete moves them
+def stored_day_keys(workout_ids, db=session):
+    workout_ids = list(workout_ids)
+
+    if not workout_ids:
+        return set()
+
+    rows = db.execute(
+        select(Workout.user_id, Workout.date).where(Workout.id.in_(workout_ids))
+    ).mappings().all()
+
+    return day_keys(rows)
+
+# Recompute daily_totals for the given (user_id, day) pairs from the workouts currently stored
+# Webhook drains, load_all's backfill threads and the cron job can all touch the same day at once, so rows are
+# upserted and only the keys that no longer have any workouts are deleted, by primary key - a delete over the
+# whole day would take gap locks that deadlock against a concurrent writer's insert
+def refresh_daily_totals(keys, db=session, chunk_size=CHUNK_SIZE):
+    keys = sorted(keys)
+
+    for start in range(0, len(keys), chunk_size):
+        chunk = keys[start:start + chunk_size]
+
+        # Whole-day ranges so the date index on workouts can be used
+        workouts = totals_query().where(or_(*[
+            and_(
+                Workout.user_id == user_id,
+                Workout.date >= datetime.combine(day, datetime.min.time()),
+                Workout.date < datetime.combine(day, datetime.min.time()) + timedelta(days=1)
+            )
+            for user_id, day in chunk
+        ]))
+
+        # In key order, so concurrent writers lock rows in the same order
+        rows = [dict(zip(TOTAL_COLUMNS, row)) for row in sorted(db.execute(workouts).tuples().all())]
+        upsert(DailyTotal, rows, ['distance', 'time', 'count'], db=db)
+
+        stored = db.execute(
+            select(DailyTotal.user_id, DailyTotal.date, DailyTotal.type)
+            .where(tuple_(DailyTotal.user_id, DailyTotal.date).in_(chunk))
+        ).tuples().all()
+
+        stale = set(stored) - {(row['user_id'], row['date'], row['type']) for row in rows}
+
+        if stale:
+            db.execute(delete(DailyTotal).where(
+                tuple_(DailyTotal.user_id, DailyTotal.date, DailyTotal.type).in_(sorted(stale))
+            ))
+
+# Throw away and recompute every daily total
+def rebuild_daily_totals(db=session):
+    db.execute(delete(DailyTotal))
+    db.execute(insert(DailyTotal).from_select(TOTAL_COLUMNS, totals_query()))
@@ -13,3 +13,55 @@ def format_seconds(seconds):
         return f"{minutes}:{seconds_int:02d}.{tenths}"
     else:
         return f'{seconds_int}.{tenths}'
+
+# Give a result the same index as the Series it came from, or leave it as an array
+def _like(values, source):
+    # Only pandas objects have .iloc - checking for it avoids importing pandas for plain arrays
+    if not hasattr(source, 'iloc'):
+        return values
+
+    import pandas as pd
+    # object dtype keeps the None for missing values - pandas 3 would infer str and turn them into NaN
+    return pd.Series(values, index=source.index, dtype=object)
+
+# Vectorised format_seconds for a NumPy array or pandas Series of seconds - identical strings, built in bulk
+# Missing or infinite values (e.g. a split over zero metres) come out as None rather than raising
+def format_seconds_array(seconds):
+    import numpy as np
+
+    values = np.asarray(seconds, dtype=np.float64)
+    finite = np.isfinite(values)
+    values = np.where(finite, values, 0)
+
+    # Same arithmetic as format_seconds, so float rounding matches digit for digit
+    hours = (values // 3600).astype(np.int64)
+    minutes = ((values % 3600) // 60).astype(np.int64)
+    seconds_remainder = values % 60
+    seconds_int = seconds_remainder.astype(np.int64)
+    tenths = ((seconds_remainder - seconds_int) * 10).astype(np.int64)
+
+    short = np.char.add(np.char.add(seconds_int.astype(str), '.'), tenths.astype(str))
+    padded = np.char.add(np.char.add(np.char.zfill(seconds_int.astype(str), 2), '.'), tenths.astype(str))
+    with_minutes = np.char.add(np.char.add(minutes.astype(str), ':'), padded)
+    with_hours = np.char.add(np.char.add(hours.astype(str), ':'),
+                             np.char.add(np.char.add(np.char.zfill(minutes.astype(str), 2), ':'), padded))
+
+    formatted = np.where(hours > 0, with_hours, np.where(minutes > 0, with_minutes, short)).astype(object)
+    formatted[~finite] = None
+
+    return _like(formatted, seconds)
+
+# Concept2 times are stored in deciseconds
+def format_deciseconds(deciseconds):
+    import numpy as np
+
+    return _like(format_seconds_array(np.asarray(deciseconds, dtype=np.float64) / 10), deciseconds)
+
+# 500m splits for arrays of times (deciseconds) and distances (metres), rounded to a tenth as the pages show them
+def format_splits(times, distances):
+    import numpy as np
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        splits = np.round((np.asarray(times, dtype=np.float64) / 10) / (np.asarray(distances, dtype=np.float64) / 500), 1)
+
+    return _like(format_seconds_array(splits), times)
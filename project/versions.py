@@ -0,0 +1,53 @@
+import hashlib
+import json
+import uuid
+from datetime import datetime
+
+from sqlalchemy import select
+
+from dcbc.models.versiondb import DataVersion
+from dcbc.models.usersdb import User
+from dcbc.project.session import session, upsert
+
+# Scope covering every member's workouts, for the club-wide charts
+CLUB_SCOPE = 'club'
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+# Give each scope a fresh version, in the caller's transaction so it lands with the data it describes
+# A new random token rather than a counter, so concurrent writers never need to read-modify-write
+def bump_versions(user_ids):
+    scopes = {user_scope(user_id) for user_id in user_ids if user_id is not None}
+
+    if not scopes:
+        return
+
+    scopes.add(CLUB_SCOPE)
+
+    now = datetime.now()
+    rows = [{'scope': scope, 'version': uuid.uuid4().hex, 'updated_at': now} for scope in sorted(scopes)]
+
+    upsert(DataVersion, rows, ['version', 'updated_at'])
+
+# Current version of a scope - '0' until its data first changes
+def data_version(scope):
+    return session.execute(select(DataVersion.version).where(DataVersion.scope == scope)).scalar() or '0'
+
+# Fingerprint of what the club charts show about members - names, colours, and who is Inactive
+# Those are edited from many pages and bump no version, so they are read afresh (one small query) for each club chart
+def members_version():
+    rows = session.execute(
+        select(User.crsid, User.logbookid, User.preferred_name, User.last_name, User.color, User.tags).order_by(User.crsid)
+    ).all()
+
+    members = [
+        [crsid, logbookid, preferred_name, last_name, color, 'Inactive' in (tags or '').split(',')]
+        for crsid, logbookid, preferred_name, last_name, color, tags in rows
+    ]
+
+    return hashlib.sha256(json.dumps(members).encode()).hexdigest()[:16]
+
+# Version of the club-wide charts - changes with anyone's workouts, or with the members shown
+def club_version():
+    return f'{data_version(CLUB_SCOPE)}-{members_version()}'
@@ -0,0 +1,130 @@
+from flask import Blueprint, request, jsonify, make_response
+from sqlalchemy import select
+
+from dcbc.project.auth_utils import auth_decorator, superuser_check
+from dcbc.models.usersdb import User
+from dcbc.models.workout import Workout
+from dcbc.project.session import session
+from dcbc.project.versions import data_version, user_scope, club_version
+from dcbc.project.plot_cache import plot_cache
+from dcbc.project.downsample import target_points
+from dcbc.project.charts import CHART_API_VERSION, plot_payload, pbs_payload, club_payload, strokes_payload
+from dcbc.project.queries import workout_page, table_query
+
+# Chart data for the analytics pages, drawn in the browser by static/js/charts.js, and the workout table
+# Behind the same Raven login as the pages themselves
+api_bp = Blueprint('api', __name__, url_prefix=f'/api/v{CHART_API_VERSION}')
+
+# Default window when a chart is asked for without dates - the current season
+DEFAULT_FROM_DATE = '2024-10-01'
+DEFAULT_TO_DATE = '2025-06-30'
+
+def date_window(args):
+    if 'from_date' in args and 'to_date' in args:
+        return args.get('from_date'), args.get('to_date')
+
+    return DEFAULT_FROM_DATE, DEFAULT_TO_DATE
+
+# JSON for a chart, tagged with an ETag from its data version and parameters
+# A browser revalidating an unchanged chart gets a bare 304 without the payload being built or read
+# build() returning None means there is nothing to draw, which is a 404
+def chart_response(route, version, params, build, cache=True):
+    etag = plot_cache.key(route, version, params)
+
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        payload = plot_cache.cached(route, version, params, build) if cache else build()
+
+        if payload is None:
+            return jsonify({'error': 'No chart data'}), 404
+
+        response = jsonify(payload)
+
+    response.set_etag(etag)
+
+    # Kept by the browser, but always checked against the ETag before use
+    response.headers['Cache-Control'] = 'private, no-cache'
+
+    return response
+
+# The logbook id of the user whose charts are wanted - only superusers may look at someone else's
+# Returns (logid, error response)
+def chart_user(args):
+    crsid = auth_decorator.principal
+
+    if 'crsid' in args and args.get('crsid') != crsid:
+        if not superuser_check(crsid):
+            return None, (jsonify({'error': 'Forbidden'}), 403)
+
+        crsid = args.get('crsid')
+
+    logid = session.execute(select(User.logbookid).where(User.crsid == crsid)).scalar()
+
+    if logid is None:
+        return None, (jsonify({'error': 'User not found'}), 404)
+
+    return logid, None
+
+@api_bp.route('/plot')
+def plot():
+    logid, error = chart_user(request.args)
+
+    if error:
+        return error
+
+    from_date, to_date = date_window(request.args)
+
+    return chart_response('api_plot', data_version(user_scope(logid)), (logid, from_date, to_date),
+                          lambda: plot_payload(logid, from_date, to_date))
+
+@api_bp.route('/pbs')
+def pbs():
+    logid, error = chart_user(request.args)
+
+    if error:
+        return error
+
+    return chart_response('api_pbs', data_version(user_scope(logid)), (logid,), lambda: pbs_payload(logid))
+
+@api_bp.route('/club')
+def club():
+    from_date, to_date = date_window(request.args)
+    points = target_points(request.args)
+
+    return chart_response('api_club', club_version(), (from_date, to_date, points),
+                          lambda: club_payload(from_date, to_date, points))
+
+# Strokes never change once stored, so the workout id stands in for a data version
+# and they are not copied into the chart cache
+@api_bp.route('/workout/<int:workout_id>')
+def workout(workout_id):
+    logid, error = chart_user(request.args)
+
+    if error:
+        return error
+
+    owned = session.execute(
+        select(Workout.id).where(Workout.id == workout_id, Workout.user_id == logid)
+    ).first()
+
+    if owned is None:
+        return jsonify({'error': 'Workout not found'}), 404
+
+    points = target_points(request.args)
+
+    return chart_response('api_workout', str(workout_id), (points,),
+                          lambda: strokes_payload(workout_id, points), cache=False)
+
+# One page of the workout table - same filters, sorting and paging as /data
+@api_bp.route('/workouts')
+def workouts():
+    logid, error = chart_user(request.args)
+
+    if error:
+        return error
+
+    query = table_query(request.args)
+
+    return chart_response('api_workouts', data_version(user_scope(logid)), (logid, *sorted(query.items())),
+                          lambda: workout_page(logid, **query), cache=False)
@@ -16,6 +16,7 @@ from dcbc.models.workout import Workout
 from dcbc.project.session import session  # Assuming your database session is set up in another file
 
 from dcbc.project.utils import format_seconds
+from dcbc.project.pbs import PIECES, club_bests, ranked_on_time
 
 
 # Define the blueprint
@@ -245,6 +246,21 @@ def races():
 
     return(render_template('races.html', races_events = races_events))
 
+# Club PB board, read straight from the PB index
+@captains_bp.route('/pbs')
+def pb_board():
+    board = club_bests()
+
+    pieces = []
+    for piece, entries in board.items():
+        for entry in entries:
+            entry['result'] = format_seconds(entry['time'] / 10) if ranked_on_time(piece) else f"{entry['distance']}m"
+            entry['date'] = entry['date'].date() if entry['date'] else None
+
+        pieces.append({'piece': piece, 'name': PIECES[piece]['name'], 'entries': entries})
+
+    return(render_template('pbboard.html', pieces=pieces))
+
 # boat builder!
 @captains_bp.route('/boats', methods=['GET', 'POST'])
 def set_boats():
@@ -5,16 +5,11 @@ import calendar
 import json
 import base64
 import os
-import pyotp
-import qrcode
 from io import BytesIO
 from sqlalchemy import select, asc, and_, update, not_, func
 import urllib.parse
 
-import pandas as pd
-from bokeh.plotting import figure
-from bokeh.embed import components
-from bokeh.models import ColumnDataSource, HoverTool, NumeralTickFormatter
+# pandas, bokeh, pyotp and qrcode are imported inside the routes that use them, so workers boot without them
 
 # Import necessary utilities and decorators
 from dcbc.project.auth_utils import auth_decorator, superuser_check
@@ -27,6 +22,10 @@ from dcbc.models.workout import Workout
 
 from dcbc.project.session import session, engine  # Assuming your database session is set up in another file
 from dcbc.project.utils import format_seconds
+from dcbc.project.versions import club_version
+from dcbc.project.downsample import target_points
+from dcbc.project.charts import CHART_API_VERSION, club_payload
+from dcbc.routes.api import chart_response, date_window
 
 
 # Define the blueprint
@@ -45,6 +44,9 @@ def before_request():
 
 @coach_bp.route('/', methods=['GET', 'POST'])
 def coach():
+    import pyotp
+    import qrcode
+
     coach_file = 'dcbc/data/coaches.txt'
     approved_file = 'dcbc/data/approved_coaches.txt'
 
@@ -178,6 +180,8 @@ def coach():
 
 @coach_bp.route('/outings', methods=['GET', 'POST'])
 def outings():
+    import pandas as pd
+
 
     if 'weekof' in request.args:
 
@@ -248,6 +252,8 @@ def outings():
 
 @coach_bp.route('/outing')
 def coach_outing():
+    import pandas as pd
+
 
     referrer = request.referrer
 
@@ -316,101 +322,16 @@ def coach_outing():
 
 @coach_bp.route('/view')
 def view():
-    if True:
-        crsids = session.execute(
-                                select(User.crsid).where(
-                                    not_(func.find_in_set('Inactive', User.tags))
-                                )
-                            ).scalars().all()
-        args = request.args
-
-        dfs = []
-
-        totaldist = 0
-        totaltime = 0
-
-        if 'from_date' in args and 'to_date' in args:
-            from_date = args.get('from_date')
-            to_date = args.get('to_date')
-
-        else:
-            from_date = datetime.strptime('2024-10-01', '%Y-%m-%d')
-            to_date = datetime.strptime('2025-06-30', '%Y-%m-%d')
-
-        for crsid in crsids:
-            logid = session.execute(select(User.logbookid).where(User.crsid == crsid)).scalar()
-
-            query = select(Workout).where(Workout.user_id == logid, Workout.type == "rower")
-
-            userdf = pd.read_sql(query, engine)
-
-            userdf['date'] = pd.to_datetime(userdf['date'])
-            userdf['distance'] = pd.to_numeric(userdf['distance'], errors='coerce')
-
-            userdf = userdf[(userdf['date'] >= from_date) & (userdf['date'] <= to_date)]
-
-            tdf = pd.DataFrame({f'{crsid}_date': userdf['date'],
-                                f'{crsid}_distance': userdf['distance']})
-
-            tdf = tdf.sort_values(f'{crsid}_date')
-
-            dfs.append(tdf)
-
-            totaldist += userdf['distance'].sum()
-            totaltime += userdf['time'].sum()
-
-        totaltime = format_seconds(totaltime/10)
-
-        try:
-            clubdf = pd.concat(dfs, axis=0, ignore_index=True)
-        except:
-            return(render_template(
-            template_name_or_list='club.html',
-            script='',
-            div=['<p>No user data found! Make sure some data exists. </p>'], totaldist = 0, totaltime = 0,
-            clubdf = [],
-            club = url_for('club'), home = url_for('index'), data_url = url_for('data'), plot=url_for('plot')))
-
-        p1 = figure(height=350, sizing_mode='stretch_width', x_axis_type='datetime', tools='pan,box_zoom,wheel_zoom,reset,save', active_scroll='wheel_zoom')
-
-        p1.toolbar.logo = None
-
-        for crsid in crsids:
-            if f'{crsid}_date' not in clubdf:
-                continue
-
-            date=clubdf[f'{crsid}_date']
-            distance=clubdf[f'{crsid}_distance'].cumsum()
-            idcolor = session.execute(select(User.color).where(User.crsid == crsid)).scalar()
-            idname = session.execute(select(User.preferred_name).where(User.crsid == crsid)).scalar() + ' ' + session.execute(select(User.last_name).where(User.crsid == crsid)).scalar()
-
-            source = ColumnDataSource(data=dict(
-                x=date,
-                y=distance,
-                legend_label=[idname] * len(date)  # Repeat crsid for each data point
-            ))
-
-            p1.line(
-                x='x',
-                y='y',
-                source=source,
-                alpha=0.8,
-                line_width=3,
-                line_color=idcolor)
-
-
-        hover = HoverTool(tooltips=[
-            ('Name','@legend_label')
-        ], mode='mouse')
-
-        p1.add_tools(hover)
-
-        p1.yaxis.formatter = NumeralTickFormatter(format='0.0a')
-
-        script1, div1 = components(p1)
-
-        return(render_template(
-            template_name_or_list='coachclub.html',
-            script=[script1],
-            div=[div1], totaldist = totaldist, totaltime = totaltime,
-            clubdf = clubdf))
+    # Drawn in the browser from the JSON endpoint below, which also fills in the totals
+    return(render_template(
+        template_name_or_list='coachclub.html',
+        chart_url=url_for('coaches.club_chart', **request.args.to_dict())))
+
+# Rowing-only club chart data for the view above, behind the coach login rather than Raven
+@coach_bp.route(f'/api/v{CHART_API_VERSION}/club')
+def club_chart():
+    from_date, to_date = date_window(request.args)
+    points = target_points(request.args)
+
+    return chart_response('api_coach_club', club_version(), (from_date, to_date, points),
+                          lambda: club_payload(from_date, to_date, points, types=['rower']))
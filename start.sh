@@ -8,5 +8,9 @@ source /societies/downingboatclub/pass.sh
 # Change to the parent directory
 cd ..
 
+# Bring the schema up to date before the workers start
+/societies/downingboatclub/Prod/bin/python -m dcbc.manage migrate
+
 # Start Gunicorn from the parent directory
-exec /societies/downingboatclub/Prod/bin/gunicorn -w 4 -b 0.0.0.0:21389 dcbc.app:app > dcbc/gunicorn.log 2>&1
+# --preload builds the app (and derives the keys) once in the master; workers fork from it
+exec /societies/downingboatclub/Prod/bin/gunicorn --preload -w 4 -b 0.0.0.0:21389 'dcbc.app:create_app()' > dcbc/gunicorn.log 2>&1
@@ -0,0 +1,228 @@
+// Draws the analytics charts in the browser with BokehJS, from the JSON served under /api/v1
+// Every element with a data-chart attribute is filled in once the page (and Bokeh) has loaded
+
+const ONE_DAY = 24 * 60 * 60 * 1000; // Bar width on a datetime axis, in milliseconds
+
+// Seconds shown as minutes:seconds.tenths
+const SPLIT_TICKS = `
+    var minutes = Math.floor(tick / 60);
+    var seconds = (tick % 60).toFixed(1);
+    return minutes + ":" + (seconds < 10 ? "0" : "") + seconds;
+`;
+
+const chartRequests = {};
+
+// Charts thinned on the server ask for about one point per pixel, rounded so similar screens share a cached copy
+function chartUrl(element) {
+    const url = new URL(element.dataset.src, window.location.origin);
+
+    if ('thin' in element.dataset && !url.searchParams.has('width')) {
+        url.searchParams.set('width', Math.ceil(element.clientWidth / 200) * 200 || 1200);
+    }
+
+    return url.toString();
+}
+
+// One request per URL, however many charts on the page draw from it
+function loadChart(url) {
+    if (!(url in chartRequests)) {
+        chartRequests[url] = fetch(url, { credentials: 'same-origin' }).then(response => {
+            if (!response.ok) {
+                throw new Error('Chart data request failed: ' + response.status);
+            }
+            return response.json();
+        });
+    }
+
+    return chartRequests[url];
+}
+
+// A stretch-width chart with a datetime x axis; data-tools swaps in a custom toolbar with scroll zoom
+function newFigure(element, options) {
+    const defaults = { height: 350, sizing_mode: 'stretch_width', x_axis_type: 'datetime' };
+
+    if (element.dataset.tools) {
+        defaults.tools = element.dataset.tools;
+        defaults.active_scroll = 'wheel_zoom';
+    }
+
+    const figure = Bokeh.Plotting.figure(Object.assign(defaults, options || {}));
+
+    if (element.dataset.tools) {
+        figure.toolbar.logo = null;
+    }
+
+    return figure;
+}
+
+function largest(values) {
+    return values.reduce((max, value) => (value !== null && value > max ? value : max), 0);
+}
+
+function setText(id, text) {
+    const element = document.getElementById(id);
+
+    if (element) {
+        element.textContent = text;
+    }
+}
+
+// /plot - running distance, with each day's pieces stacked as bars that open the workout when tapped
+function drawPlot(element, data) {
+    const figure = newFigure(element);
+
+    figure.line({ field: 'date' }, { field: 'cumulative' }, {
+        source: new Bokeh.ColumnDataSource({ data: { date: data.date, cumulative: data.cumulative } }),
+        color: 'magenta',
+        alpha: 0.8,
+        line_width: 3
+    });
+
+    figure.left[0].formatter = new Bokeh.NumeralTickFormatter({ format: '0.0a' });
+
+    const source = new Bokeh.ColumnDataSource({
+        data: { id: data.id, day: data.day, top: data.top, base: data.base, distance: data.distance, split: data.split }
+    });
+
+    figure.extra_y_ranges = { daily: new Bokeh.Range1d({ start: 0, end: largest(data.top) }) };
+    figure.add_layout(new Bokeh.LinearAxis({ y_range_name: 'daily', axis_label: 'Daily Metres' }), 'right');
+
+    const bars = figure.vbar({
+        x: { field: 'day' },
+        top: { field: 'top' },
+        bottom: { field: 'base' },
+        width: ONE_DAY,
+        color: 'grey',
+        alpha: 0.8,
+        source: source,
+        y_range_name: 'daily'
+    });
+
+    const tap = new Bokeh.TapTool({
+        callback: new Bokeh.CustomJS({
+            args: { source: source, crsid: element.dataset.crsid },
+            code: `
+                var selected_indices = source.selected.indices;
+
+                if (selected_indices.length > 0) {
+                    // Redirect to the Flask route with the workout id as a parameter
+                    window.location.href = '/workout?id=' + source.data['id'][selected_indices[0]] + '&crsid=' + crsid;
+                }
+            `
+        })
+    });
+
+    const hover = new Bokeh.HoverTool({
+        tooltips: [['Date', '@day{%F}'], ['Distance', '@distance'], ['Split', '@split']],
+        formatters: { '@day': 'datetime' },
+        mode: 'mouse',
+        renderers: [bars]
+    });
+
+    figure.add_tools(tap, hover);
+
+    Bokeh.Plotting.show(figure, element);
+}
+
+// /pbs - every attempt at one piece (data-piece), with the PB line over the top
+function drawPbs(element, data) {
+    const chart = data[element.dataset.piece];
+
+    if (!chart || chart.attempts.date.length === 0) {
+        element.innerHTML = element.dataset.empty;
+        return;
+    }
+
+    const figure = newFigure(element);
+
+    figure.scatter({ field: 'date' }, { field: 'value' }, {
+        source: new Bokeh.ColumnDataSource({ data: chart.attempts }),
+        color: 'black',
+        alpha: 0.8
+    });
+
+    figure.line({ field: 'date' }, { field: 'value' }, {
+        source: new Bokeh.ColumnDataSource({ data: chart.pbs }),
+        color: '#bb0088',
+        alpha: 0.8,
+        line_width: 3
+    });
+
+    if (chart.measure === 'time') {
+        figure.left[0].formatter = new Bokeh.CustomJSTickFormatter({ code: SPLIT_TICKS });
+    }
+
+    Bokeh.Plotting.show(figure, element);
+}
+
+// /club and the coaches' view - each member's running distance in their own colour, plus the totals table
+function drawClub(element, data) {
+    setText('totalDistance', data.totaldist);
+    setText('totalTime', data.totaltime);
+
+    if (data.members.length === 0) {
+        element.innerHTML = element.dataset.empty;
+        return;
+    }
+
+    const figure = newFigure(element);
+
+    data.members.forEach(member => {
+        figure.line({ field: 'date' }, { field: 'distance' }, {
+            source: new Bokeh.ColumnDataSource({
+                data: { date: member.date, distance: member.distance, name: member.date.map(() => member.name) }
+            }),
+            alpha: 0.8,
+            line_width: 3,
+            line_color: member.color
+        });
+    });
+
+    figure.add_tools(new Bokeh.HoverTool({ tooltips: [['Name', '@name']], mode: 'mouse' }));
+    figure.left[0].formatter = new Bokeh.NumeralTickFormatter({ format: '0.0a' });
+
+    Bokeh.Plotting.show(figure, element);
+}
+
+// /workout - pace and stroke rate through the piece
+function drawWorkout(element, data) {
+    const figure = newFigure(element, {
+        y_range: new Bokeh.Range1d({ start: data.pace_range[0] * 0.8, end: data.pace_range[1] * 1.2 })
+    });
+
+    figure.line({ field: 't' }, { field: 'p' }, {
+        source: new Bokeh.ColumnDataSource({ data: data.pace }),
+        color: 'magenta',
+        alpha: 0.8,
+        line_width: 3
+    });
+
+    figure.extra_y_ranges = { spm: new Bokeh.Range1d({ start: 0, end: data.spm_max * 1.2 }) };
+    figure.add_layout(new Bokeh.LinearAxis({ y_range_name: 'spm', axis_label: 'Strokes per Minute' }), 'right');
+
+    figure.line({ field: 't' }, { field: 'spm' }, {
+        source: new Bokeh.ColumnDataSource({ data: data.rate }),
+        color: 'grey',
+        alpha: 0.8,
+        line_width: 3,
+        y_range_name: 'spm'
+    });
+
+    figure.below[0].formatter = new Bokeh.CustomJSTickFormatter({ code: SPLIT_TICKS });
+    figure.left[0].formatter = new Bokeh.CustomJSTickFormatter({ code: SPLIT_TICKS });
+
+    Bokeh.Plotting.show(figure, element);
+}
+
+const CHARTS = { plot: drawPlot, pbs: drawPbs, club: drawClub, workout: drawWorkout };
+
+window.addEventListener('load', function() {
+    document.querySelectorAll('[data-chart]').forEach(element => {
+        loadChart(chartUrl(element))
+            .then(data => CHARTS[element.dataset.chart](element, data))
+            .catch(error => {
+                console.error(error);
+                element.textContent = 'Could not load this chart - try refreshing the page.';
+            });
+    });
+});